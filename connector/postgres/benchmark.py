@@ -0,0 +1,151 @@
+import json
+import sys
+import time
+
+from sqlalchemy import text
+
+from connector.postgres.postgres import PostgreSQLWrapper
+
+# Seeds realistic volumes with set-based inserts. Everything runs inside a transaction that is
+# rolled back, so the benchmark leaves the database untouched.
+SEED_STATEMENTS = [
+    "INSERT INTO project (name) SELECT 'benchmark ' || g FROM generate_series(1, :projects) g",
+    'INSERT INTO "chatBotAnswers" (text) VALUES (\'benchmark\')',
+    "INSERT INTO issues (name) SELECT 'benchmark ' || g FROM generate_series(1, 100) g",
+    "INSERT INTO topics (name) SELECT 'benchmark ' || g FROM generate_series(1, 100) g",
+    """
+    INSERT INTO "userMessages" (project_id, answer_id, chat_id, date, processed, question)
+    SELECT (SELECT min(id) FROM project) + g % :projects, (SELECT max(id) FROM "chatBotAnswers"), g / 10,
+           now() - g * interval '1 minute', g % 100 <> 0, 'benchmark'
+    FROM generate_series(1, :rows) g
+    """,
+    """
+    INSERT INTO feedbacks (project_id, date, source, text)
+    SELECT (SELECT min(id) FROM project) + g % :projects, now() - g * interval '1 minute', 'benchmark', 'benchmark'
+    FROM generate_series(1, :rows / 10) g
+    """,
+    """
+    INSERT INTO "issues_userMessages" (issue_id, user_message_id)
+    SELECT (SELECT min(id) FROM issues) + id % 100, id FROM "userMessages"
+    """,
+    """
+    INSERT INTO "topics_userMessages" (topic_id, user_message_id)
+    SELECT (SELECT min(id) FROM topics) + id % 100, id FROM "userMessages"
+    """,
+    """
+    INSERT INTO feedbacks_issues (feedback_id, issue_id)
+    SELECT id, (SELECT min(id) FROM issues) + id % 100 FROM feedbacks
+    """,
+    """
+    INSERT INTO report (status, project_id, max_user_message_id, type, subtype)
+    SELECT 'done', p.id, 0, t.type::reporttype, s.subtype::reportsubtype
+    FROM project p, unnest(enum_range(NULL::reporttype)::text[]) t(type),
+         unnest(enum_range(NULL::reportsubtype)::text[]) s(subtype)
+    """,
+    'ANALYZE project, "userMessages", feedbacks, "issues_userMessages", "topics_userMessages", feedbacks_issues, report',
+]
+
+# The hot-path lookups and the index each of them is expected to use.
+HOT_PATH_QUERIES = {
+    'user messages by project and date': (
+        """SELECT * FROM "userMessages" WHERE project_id = (SELECT min(id) FROM project)
+           ORDER BY date DESC LIMIT 50""",
+        'ix_userMessages_project_date'),
+    'user messages keyset page': (
+        """SELECT * FROM "userMessages" WHERE project_id = (SELECT min(id) FROM project) AND id > :rows / 2
+           ORDER BY id LIMIT 50""",
+        'ix_userMessages_project_id'),
+    'user messages by chat': (
+        'SELECT * FROM "userMessages" WHERE chat_id = 42',
+        'ix_userMessages_chat_id'),
+    'unclaimed user messages': (
+        'SELECT id FROM "userMessages" WHERE processed = false AND queued_at IS NULL ORDER BY id LIMIT 100',
+        'ix_userMessages_unclaimed'),
+    'feedbacks by project and date': (
+        """SELECT * FROM feedbacks WHERE project_id = (SELECT min(id) FROM project)
+           ORDER BY date DESC LIMIT 50""",
+        'ix_feedbacks_project_date'),
+    'issues of a user message': (
+        'SELECT issue_id FROM "issues_userMessages" WHERE user_message_id = 42',
+        'ix_issues_userMessages_user_message_id'),
+    'user messages of a topic': (
+        """SELECT user_message_id FROM "topics_userMessages" WHERE topic_id = (SELECT min(id) FROM topics)""",
+        'ix_topics_userMessages_topic_id'),
+    'feedbacks of an issue': (
+        'SELECT feedback_id FROM feedbacks_issues WHERE issue_id = (SELECT min(id) FROM issues)',
+        'ix_feedbacks_issues_issue_id'),
+    'report lookup': (
+        """SELECT * FROM report WHERE project_id = (SELECT min(id) FROM project)
+           AND type = 'HELPFULNESS' AND subtype = 'BY_INTERACTION'""",
+        'uix_report_lookup'),
+}
+
+
+def _params_of(statement, params):
+    """
+        Picks the parameters a statement actually binds.
+    """
+    return {key: value for key, value in params.items() if f':{key}' in statement}
+
+
+def _index_names(plan):
+    """
+        Collects the names of every index used anywhere in an EXPLAIN (FORMAT JSON) plan node.
+    """
+    names = {plan['Index Name']} if 'Index Name' in plan else set()
+    for child in plan.get('Plans', []):
+        names |= _index_names(child)
+    return names
+
+
+def check_index_plans(wrapper: PostgreSQLWrapper, rows: int = 200000, projects: int = 50) -> dict:
+    """
+        Seeds realistic volumes and checks that every hot-path query is planned on its expected index.
+
+        The seed data is inserted and analyzed inside a transaction that is rolled back afterwards.
+        On a database created before the indexes were declared, run ``PostgreSQLWrapper.create_indexes`` first.
+
+        :param wrapper: The wrapper connected to the database to check.
+        :type wrapper: PostgreSQLWrapper
+        :param rows: The number of user messages to seed.
+        :type rows: int
+        :param projects: The number of projects the seeded rows are spread over.
+        :type projects: int
+        :return: For every query, whether it used its expected index, the indexes it used and its execution time.
+        :rtype: dict
+    """
+    params = {'rows': rows, 'projects': projects}
+    results = {}
+
+    with wrapper.engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            for statement in SEED_STATEMENTS:
+                connection.execute(text(statement), _params_of(statement, params))
+
+            for name, (query, expected_index) in HOT_PATH_QUERIES.items():
+                plan = connection.execute(text(f'EXPLAIN (ANALYZE, FORMAT JSON) {query}'),
+                                          _params_of(query, params)).scalar()
+                plan = plan if isinstance(plan, list) else json.loads(plan)
+                used = _index_names(plan[0]['Plan'])
+                results[name] = {
+                    'ok': expected_index in used,
+                    'expected_index': expected_index,
+                    'used_indexes': sorted(used),
+                    'execution_ms': plan[0]['Execution Time'],
+                }
+        finally:
+            transaction.rollback()
+
+    return results
+
+
+if __name__ == '__main__':
+    # usage: python -m connector.postgres.benchmark <uri> [rows]
+    start = time.perf_counter()
+    results = check_index_plans(PostgreSQLWrapper(sys.argv[1]), rows=int(sys.argv[2]) if len(sys.argv) > 2 else 200000)
+    for name, result in results.items():
+        status = 'ok' if result['ok'] else 'MISSING'
+        print(f"{status:8} {name}: {result['used_indexes']} ({result['execution_ms']:.2f} ms)")
+    print(f"checked {len(results)} queries in {time.perf_counter() - start:.1f}s")
+    sys.exit(0 if all(result['ok'] for result in results.values()) else 1)
@@ -0,0 +1,93 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """
+        A bounded, thread-safe least-recently-used cache.
+
+        Entries optionally expire ``ttl`` seconds after they are cached. Lookups are counted
+        as hits or misses.
+
+        :param max_size: The maximum number of entries kept in the cache.
+        :type max_size: int
+        :param ttl: The number of seconds an entry stays valid, or None to never expire.
+        :type ttl: float | None
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = None):
+        """
+            Initializes the LRUCache instance.
+
+            :param max_size: The maximum number of entries kept in the cache.
+            :type max_size: int
+            :param ttl: The number of seconds an entry stays valid, or None to never expire.
+            :type ttl: float | None
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        """
+            Returns the value cached under a key and marks it as recently used.
+
+            :param key: The key to look up.
+            :param default: The value returned when the key is not cached.
+            :return: The cached value, or ``default``.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+            Caches a value under a key, evicting the least recently used entry if the cache is full.
+
+            :param key: The key to cache the value under.
+            :param value: The value to cache.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+            Removes every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+            Returns the size of the cache and its hit and miss counters.
+
+            :return: The number of entries, the maximum size, hits, misses and the hit rate.
+            :rtype: dict
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._entries)
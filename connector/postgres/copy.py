@@ -0,0 +1,187 @@
+import io
+import queue
+import threading
+
+from sqlalchemy.dialects import postgresql
+
+# COPY options that write one JSON document per line. No JSON text contains a raw \x01 or \x02,
+# so with them as quote and delimiter CSV mode never quotes or escapes the row.
+JSONL_OPTIONS = "FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02'"
+
+CSV_OPTIONS = "FORMAT csv, HEADER true"
+
+# The number of bytes read from a file-like object per write to a psycopg 3 COPY.
+COPY_READ_SIZE = 1 << 16
+
+
+def compile_literal(stmt) -> str:
+    """
+        Compiles a statement to PostgreSQL SQL with its parameters inlined, since COPY cannot bind parameters.
+
+        :param stmt: The statement to compile.
+        :type stmt: Select
+        :return: The SQL text of the statement.
+        :rtype: str
+    """
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+
+def copy_to(dbapi_connection, sql: str, out) -> int:
+    """
+        Runs a ``COPY ... TO STDOUT`` statement and streams its output into a file-like object.
+
+        Supports both psycopg2 and psycopg 3 connections. Text files receive str, any other
+        file-like object receives bytes.
+
+        :param dbapi_connection: The DBAPI connection to run the statement on.
+        :param sql: The COPY statement.
+        :type sql: str
+        :param out: The file-like object the output is written to.
+        :return: The number of rows copied.
+        :rtype: int
+    """
+    text_mode = isinstance(out, io.TextIOBase)
+    cursor = dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(sql, out)
+        else:
+            with cursor.copy(sql) as copy:
+                for data in copy:
+                    out.write(bytes(data).decode('utf-8') if text_mode else bytes(data))
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def copy_from(dbapi_connection, sql: str, source) -> int:
+    """
+        Runs a ``COPY ... FROM STDIN`` statement fed from a file-like object.
+
+        Supports both psycopg2 and psycopg 3 connections.
+
+        :param dbapi_connection: The DBAPI connection to run the statement on.
+        :param sql: The COPY statement.
+        :type sql: str
+        :param source: The file-like object the input is read from.
+        :return: The number of rows copied.
+        :rtype: int
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(sql, source)
+        else:
+            with cursor.copy(sql) as copy:
+                while data := source.read(COPY_READ_SIZE):
+                    copy.write(data)
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+class CopyAborted(Exception):
+    """
+        Raised on the writing side of a CopyBuffer whose reader gave up.
+    """
+
+
+class CopyBuffer:
+    """
+        A bounded pipe between a ``COPY ... TO STDOUT`` writer and a ``COPY ... FROM STDIN`` reader.
+
+        Writes are gathered into chunks of ``chunk_bytes`` and at most ``max_chunks`` chunks are
+        held at once, so a writer faster than the reader blocks until the reader catches up.
+        The writer calls ``close`` once it is done and the reader calls ``abort`` if it fails,
+        which makes the writer raise CopyAborted instead of blocking forever.
+
+        :param max_chunks: The maximum number of chunks buffered.
+        :type max_chunks: int
+        :param chunk_bytes: The size of a chunk, in bytes.
+        :type chunk_bytes: int
+    """
+
+    def __init__(self, max_chunks: int = 16, chunk_bytes: int = 1 << 20):
+        """
+            Initializes the CopyBuffer instance.
+
+            :param max_chunks: The maximum number of chunks buffered.
+            :type max_chunks: int
+            :param chunk_bytes: The size of a chunk, in bytes.
+            :type chunk_bytes: int
+        """
+        self.chunk_bytes = chunk_bytes
+        self._queue = queue.Queue(max_chunks)
+        self._aborted = threading.Event()
+        self._writing = bytearray()
+        self._reading = b''
+        self._offset = 0
+        self._done = False
+
+    def write(self, data) -> int:
+        """
+            Buffers data, blocking while the buffer is full.
+
+            :param data: The data to buffer.
+            :type data: bytes | str
+            :return: The number of characters or bytes written.
+            :rtype: int
+            :raises CopyAborted: If the reader aborted.
+        """
+        self._writing += data.encode('utf-8') if isinstance(data, str) else data
+        if len(self._writing) >= self.chunk_bytes:
+            self._put(bytes(self._writing))
+            self._writing.clear()
+        return len(data)
+
+    def close(self):
+        """
+            Flushes the buffered data and signals the end of the input to the reader.
+
+            :raises CopyAborted: If the reader aborted.
+        """
+        if self._writing:
+            self._put(bytes(self._writing))
+            self._writing.clear()
+        self._put(None)
+
+    def abort(self):
+        """
+            Makes pending and future writes raise CopyAborted.
+        """
+        self._aborted.set()
+
+    def read(self, size: int = -1) -> bytes:
+        """
+            Reads up to ``size`` bytes, blocking until data is available or the writer closes.
+
+            :param size: The maximum number of bytes to read, or -1 to read until the writer closes.
+            :type size: int
+            :return: The data read, empty once the input is exhausted.
+            :rtype: bytes
+        """
+        parts = []
+        while size < 0 or size > 0:
+            if self._offset == len(self._reading):
+                chunk = None if self._done else self._queue.get()
+                if chunk is None:
+                    self._done = True
+                    break
+                self._reading, self._offset = chunk, 0
+
+            end = len(self._reading) if size < 0 else min(len(self._reading), self._offset + size)
+            parts.append(self._reading[self._offset:end])
+            size -= 0 if size < 0 else end - self._offset
+            self._offset = end
+        return b''.join(parts)
+
+    def _put(self, chunk):
+        while True:
+            if self._aborted.is_set():
+                raise CopyAborted("The COPY reader aborted")
+            try:
+                self._queue.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
@@ -0,0 +1,143 @@
+import time
+from threading import Lock
+
+from sqlalchemy import create_engine, event, exc, make_url
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMonitor:
+    """
+        Collects connection pool statistics from SQLAlchemy pool events.
+
+        Tracks the number of checkouts and checkout timeouts, the time spent waiting for a
+        connection on checkout and the age of every open connection.
+    """
+
+    def __init__(self):
+        """
+            Initializes the PoolMonitor instance.
+        """
+        self._lock = Lock()
+        self._connected_at = {}
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def attach(self, engine):
+        """
+            Registers the monitor on the pool events of an engine.
+
+            :param engine: The engine whose pool is monitored.
+            :type engine: Engine
+        """
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'close', self._on_close)
+        event.listen(engine, 'invalidate', self._on_close)
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        """
+            Records the time a single checkout waited for a connection.
+
+            :param seconds: The time spent waiting, in seconds.
+            :type seconds: float
+            :param timed_out: Whether the checkout gave up waiting.
+            :type timed_out: bool
+        """
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self._connected_at[id(connection_record)] = time.monotonic()
+
+    def _on_close(self, dbapi_connection, connection_record, *args):
+        with self._lock:
+            self._connected_at.pop(id(connection_record), None)
+
+    def stats(self, pool) -> dict:
+        """
+            Returns a snapshot of the pool statistics.
+
+            :param pool: The pool the monitor is attached to.
+            :type pool: QueuePool
+            :return: The pool size, checked out and overflow connections, checkout wait times and connection ages.
+            :rtype: dict
+        """
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - connected_at for connected_at in self._connected_at.values()]
+            return {
+                'pool_size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+                'max_overflow': pool._max_overflow,
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.timeouts,
+                'checkout_wait_avg': self.wait_total / self.checkouts if self.checkouts else 0.0,
+                'checkout_wait_max': self.wait_max,
+                'connections': len(ages),
+                'connection_age_avg': sum(ages) / len(ages) if ages else 0.0,
+                'connection_age_max': max(ages, default=0.0),
+            }
+
+
+class MonitoredQueuePool(QueuePool):
+    """
+        A QueuePool that reports the time every checkout waits for a connection to its PoolMonitor.
+    """
+    monitor = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            if self.monitor is not None:
+                self.monitor.record_wait(time.perf_counter() - start, timed_out)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.monitor = self.monitor
+        return pool
+
+
+def create_monitored_engine(uri: str, pool_size: int = 5, max_overflow: int = 10, pool_timeout: float = 30,
+                            pool_recycle: int = -1, pool_pre_ping: bool = False, **kwargs):
+    """
+        Creates an engine with a configurable, monitored connection pool.
+
+        :param uri: The database URI.
+        :type uri: str
+        :param pool_size: The number of connections kept open in the pool.
+        :type pool_size: int
+        :param max_overflow: The number of connections allowed above ``pool_size``.
+        :type max_overflow: int
+        :param pool_timeout: The number of seconds to wait for a connection before giving up.
+        :type pool_timeout: float
+        :param pool_recycle: The number of seconds after which a connection is replaced, or -1 to never recycle.
+        :type pool_recycle: int
+        :param pool_pre_ping: Whether to test connections for liveness on checkout.
+        :type pool_pre_ping: bool
+        :return: The engine and the monitor attached to its pool.
+        :rtype: tuple[Engine, PoolMonitor]
+    """
+    if make_url(uri).get_driver_name() == 'psycopg2':
+        # Send executemany UPDATEs and DELETEs in pages instead of one round trip per row.
+        kwargs.setdefault('executemany_mode', 'values_plus_batch')
+
+    engine = create_engine(uri, poolclass=MonitoredQueuePool, pool_size=pool_size, max_overflow=max_overflow,
+                           pool_timeout=pool_timeout, pool_recycle=pool_recycle, pool_pre_ping=pool_pre_ping,
+                           **kwargs)
+    monitor = PoolMonitor()
+    monitor.attach(engine)
+    engine.pool.monitor = monitor
+    return engine, monitor
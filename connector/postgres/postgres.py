@@ -1,37 +1,63 @@
-from datetime import datetime
+import base64
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import enum
-
-from sqlalchemy import create_engine, Column, Integer, ForeignKey, String, Table, Float, DateTime, update, Boolean, \
-    Index, UniqueConstraint, Enum, ARRAY
+from functools import lru_cache
+import hashlib
+import itertools
+import json
+import logging
+import threading
+import time
+
+from sqlalchemy import Column, Integer, ForeignKey, String, Table, Float, DateTime, update, Boolean, \
+    Index, UniqueConstraint, Enum, ARRAY, JSON, select, func, event, case, delete, values, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy.orm import sessionmaker, scoped_session, relationship, joinedload
-from sqlalchemy import and_
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship, joinedload, selectinload, subqueryload, \
+    lazyload, raiseload, object_session
+from sqlalchemy import and_, or_, tuple_, bindparam, true, false, column
+
+from connector.postgres.cache import LRUCache
+from connector.postgres.copy import CSV_OPTIONS, JSONL_OPTIONS, compile_literal, copy_to
+from connector.postgres.pool import create_monitored_engine
+from connector.postgres.profiler import StatementProfiler
+from connector.postgres.schema import ensure_schema, create_indexes, add_missing_columns
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
 feedbacks_issues_association = Table('feedbacks_issues', Base.metadata,
                                      Column('id', Integer, primary_key=True),
                                      Column('feedback_id', Integer, ForeignKey('feedbacks.id'), primary_key=False),
-                                     Column('issue_id', Integer, ForeignKey('issues.id'), primary_key=False)
+                                     Column('issue_id', Integer, ForeignKey('issues.id'), primary_key=False),
+                                     Index('ix_feedbacks_issues_feedback_id', 'feedback_id'),
+                                     Index('ix_feedbacks_issues_issue_id', 'issue_id')
                                      )
 
 issues_userMessages_association = Table('issues_userMessages', Base.metadata,
                                         Column('id', Integer, primary_key=True),
                                         Column('issue_id', Integer, ForeignKey('issues.id'), primary_key=False),
                                         Column('user_message_id', Integer, ForeignKey('userMessages.id'),
-                                               primary_key=False))
+                                               primary_key=False),
+                                        Index('ix_issues_userMessages_issue_id', 'issue_id'),
+                                        Index('ix_issues_userMessages_user_message_id', 'user_message_id'))
 
 datasetMessage_dataset_association = Table('datasetMessage_dataset', Base.metadata,
                                            Column('id', Integer, primary_key=True),
                                            Column('dataset_id', Integer, ForeignKey('dataset.id')),
-                                           Column('dataset_message_id', Integer, ForeignKey('datesetMessage.id')))
+                                           Column('dataset_message_id', Integer, ForeignKey('datesetMessage.id')),
+                                           Index('ix_datasetMessage_dataset_dataset_id', 'dataset_id'))
 
 topics_userMessages_association = Table('topics_userMessages', Base.metadata,
                                         Column('id', Integer, primary_key=True),
                                         Column('topic_id', Integer, ForeignKey('topics.id'), primary_key=False),
                                         Column('user_message_id', Integer, ForeignKey('userMessages.id'),
-                                               primary_key=False))
+                                               primary_key=False),
+                                        Index('ix_topics_userMessages_topic_id', 'topic_id'),
+                                        Index('ix_topics_userMessages_user_message_id', 'user_message_id'))
 
 user_project_association = Table('user_projects', Base.metadata,
                                  Column('id', Integer, primary_key=True),
@@ -45,7 +71,8 @@ user_message_keyword = Table('user_message_keyword', Base.metadata,
                              Column('user_message_id', Integer, ForeignKey('userMessages.id'),
                                     primary_key=False),
                              UniqueConstraint('keyword_id', 'user_message_id',
-                                              name='uix_keyword_message_project')
+                                              name='uix_keyword_message_project'),
+                             Index('ix_user_message_keyword_user_message_id', 'user_message_id')
                              )
 
 user_message_association_custom_rules = Table('user_message_custom_rules', Base.metadata,
@@ -63,7 +90,8 @@ ruleTopics_userMessages_association = Table('ruleTopics_userMessages', Base.meta
                                             Column('user_message_id', Integer, ForeignKey('userMessages.id'),
                                                    primary_key=False),
                                             UniqueConstraint('rule_topic_id', 'user_message_id',
-                                                             name='uix_rules_topic_user_messages')
+                                                             name='uix_rules_topic_user_messages'),
+                                            Index('ix_ruleTopics_userMessages_user_message_id', 'user_message_id')
                                             )
 
 project_integration_association = Table('project_integration', Base.metadata,
@@ -77,6 +105,18 @@ project_integration_association = Table('project_integration', Base.metadata,
                                         )
 
 
+class NPlusOneError(Exception):
+    """
+        Raised when a relationship is lazy loaded more often than allowed within an N+1 detection scope.
+    """
+
+
+class RollbackOnlyError(Exception):
+    """
+        Raised when a unit of work scope exits after one of its operations failed, so it was rolled back.
+    """
+
+
 class ProcessingStatus(str, enum.Enum):
     unprocessed = 'Unprocessed'
     queued = 'Queued'
@@ -236,6 +276,11 @@ class Feedbacks(Base):
     project = relationship('Project', foreign_keys=[project_id])
     issues = relationship("Issues", secondary=feedbacks_issues_association, back_populates="feedbacks")
 
+    __table_args__ = (
+        Index('ix_feedbacks_project_date', 'project_id', 'date'),
+        Index('ix_feedbacks_project_id', 'project_id', 'id'),
+    )
+
 
 class Issues(Base):
     __tablename__ = 'issues'
@@ -307,15 +352,33 @@ class Topics(Base):
     user_messages = relationship("UserMessages", secondary=topics_userMessages_association, back_populates="topics")
 
 
+def text_digest(text: str) -> str:
+    """
+        Computes the content digest stored alongside context texts.
+
+        :param text: The context text.
+        :type text: str
+        :return: The hex encoded SHA-256 digest of the text.
+        :rtype: str
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _default_digest(context):
+    return text_digest(context.get_current_parameters()['text'])
+
+
 class Contexts(Base):
     __tablename__ = 'contexts'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     project_id = Column(Integer, nullable=True)
     text = Column(String, nullable=False)
+    digest = Column(String(64), nullable=True, default=_default_digest)
 
     __table_args__ = (
         Index('idx_content_hash', 'text', postgresql_using='hash'),
+        Index('uix_contexts_project_digest', 'project_id', 'digest', unique=True),
     )
 
 
@@ -344,6 +407,10 @@ class Chat(Base):
     intent = relationship("Intent", foreign_keys=[intent_id])
     issue = relationship("Issues", foreign_keys=[issue_id])
 
+    __table_args__ = (
+        Index('ix_chat_unprocessed', 'id', postgresql_where=(status == ProcessingStatus.unprocessed)),
+    )
+
 
 class ChatBotAnswers(Base):
     __tablename__ = 'chatBotAnswers'
@@ -378,6 +445,7 @@ class UserMessages(Base):
     complexity = Column(Enum(ComplexityEnum), nullable=True)
     verbosity = Column(Enum(VerbosityEnum), nullable=True)
     processed = Column(Boolean, default=False)
+    queued_at = Column(DateTime, nullable=True)
 
     project_id = Column(Integer, ForeignKey('project.id'), nullable=True)
     context_id = Column(Integer, ForeignKey('contexts.id'), nullable=True)
@@ -396,6 +464,13 @@ class UserMessages(Base):
     rule_topics = relationship("RuleTopic", secondary=ruleTopics_userMessages_association,
                                back_populates="user_messages")
 
+    __table_args__ = (
+        Index('ix_userMessages_project_date', 'project_id', 'date'),
+        Index('ix_userMessages_project_id', 'project_id', 'id'),
+        Index('ix_userMessages_chat_id', 'chat_id'),
+        Index('ix_userMessages_unclaimed', 'id', postgresql_where=and_(processed == false(), queued_at.is_(None))),
+    )
+
 
 class Keywords(Base):
     __tablename__ = "keywords"
@@ -448,12 +523,26 @@ class ContextsOriginal(Base):
     id = Column(Integer, nullable=False, primary_key=True)
     project_id = Column(Integer, nullable=True)
     text = Column(String, nullable=False)
+    digest = Column(String(64), nullable=True, default=_default_digest)
 
     __table_args__ = (
         Index('idx_contentOriginal_hash', 'text', postgresql_using='hash'),
+        Index('uix_contextsOriginal_project_digest', 'project_id', 'digest', unique=True),
     )
 
 
+def _sync_digest(mapper, connection, context):
+    """
+        Recomputes the digest of a context whose text is changed through the ORM.
+    """
+    if inspect(context).attrs.text.history.has_changes():
+        context.digest = text_digest(context.text)
+
+
+event.listen(Contexts, 'before_update', _sync_digest)
+event.listen(ContextsOriginal, 'before_update', _sync_digest)
+
+
 class FeedbacksOriginal(Base):
     __tablename__ = 'feedbacksOriginal'
 
@@ -558,6 +647,118 @@ class Report(Base):
     max_user_message_id = Column(Integer, nullable=False)
     type = Column(Enum(ReportType), nullable=False)
     subtype = Column(Enum(ReportSubtype), nullable=False)
+    result = Column(JSON, nullable=True)
+
+    __table_args__ = (
+        Index('uix_report_lookup', 'project_id', 'type', 'subtype', unique=True),
+    )
+
+
+# The loader options query_all applies for each relationship loading strategy. Collections are
+# best loaded with selectin, since joined loading repeats the parent row for every child.
+LOADER_STRATEGIES = {
+    'joined': joinedload,
+    'selectin': selectinload,
+    'subquery': subqueryload,
+    'lazy': lazyload,
+    'raise': raiseload,
+}
+
+# How claim_batch and complete_batch move rows of each work queue model: the condition of rows
+# waiting to be claimed, the condition of claimed rows not completed since a cutoff time, or None
+# when claims are not timed, and the values set when a row is claimed and when it is completed.
+WORK_QUEUES = {
+    Chat: {
+        'pending': Chat.status == ProcessingStatus.unprocessed,
+        'stale': None,
+        'claim': {'status': ProcessingStatus.queued},
+        'complete': {'status': ProcessingStatus.processed},
+    },
+    UserMessages: {
+        'pending': and_(UserMessages.processed == false(), UserMessages.queued_at.is_(None)),
+        'stale': lambda cutoff: and_(UserMessages.processed == false(), UserMessages.queued_at < cutoff),
+        'claim': {'queued_at': func.now()},
+        'complete': {'processed': True},
+    },
+}
+
+
+# The operators accepted by find_by_fields and the other filtered queries.
+FILTER_OPERATORS = ("==", "!=", ">", ">=", "<", "<=", "like", "ilike", "in", "not_in", "between", "is_null",
+                    "contains")
+
+
+@lru_cache(maxsize=1024)
+def _compile_filter_clause(model, shape):
+    """
+        Builds the filter clause for a filter shape, with a bound parameter in place of every value.
+
+        A shape is a tuple of (field name, operator, is_null flag) entries. Clauses are cached per
+        (model, shape), so a filter is built and compiled by SQLAlchemy only once.
+
+        :param model: The model class the filters apply to.
+        :type model: Base
+        :param shape: The filter shape.
+        :type shape: tuple
+        :return: The filter clause.
+        :rtype: ColumnElement
+        :raises ValueError: If a filter uses an unsupported operator.
+    """
+    filter_conditions = []
+
+    for position, (field_name, operator, is_null) in enumerate(shape):
+        field = getattr(model, field_name)
+        name = f"{field_name}_{position}"
+        param = bindparam(name, type_=field.type)
+
+        if operator == "==":
+            filter_conditions.append(field == param)
+        elif operator == "!=":
+            filter_conditions.append(field != param)
+        elif operator == ">":
+            filter_conditions.append(field > param)
+        elif operator == ">=":
+            filter_conditions.append(field >= param)
+        elif operator == "<":
+            filter_conditions.append(field < param)
+        elif operator == "<=":
+            filter_conditions.append(field <= param)
+        elif operator == "like":
+            filter_conditions.append(field.like(param))
+        elif operator == "ilike":
+            filter_conditions.append(field.ilike(param))
+        elif operator == "in":
+            filter_conditions.append(field.in_(bindparam(name, type_=field.type, expanding=True)))
+        elif operator == "not_in":
+            filter_conditions.append(field.not_in(bindparam(name, type_=field.type, expanding=True)))
+        elif operator == "between":
+            filter_conditions.append(field.between(bindparam(f"{name}_lower", type_=field.type),
+                                                   bindparam(f"{name}_upper", type_=field.type)))
+        elif operator == "is_null":
+            filter_conditions.append(field.is_(None) if is_null else field.is_not(None))
+        elif operator == "contains" and isinstance(field.type, ARRAY):
+            filter_conditions.append(field.op("@>")(param))
+        elif operator == "contains":
+            filter_conditions.append(field.contains(param))
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+
+    return and_(true(), *filter_conditions)
+
+
+@lru_cache(maxsize=1024)
+def _filter_statement(model, shape):
+    """
+        Returns the cached select statement for a model filtered by a filter shape.
+
+        :param model: The model class to query.
+        :type model: Base
+        :param shape: The filter shape, as accepted by ``_compile_filter_clause``.
+        :type shape: tuple
+        :return: The select statement.
+        :rtype: Select
+    """
+    return select(model).where(_compile_filter_clause(model, shape))
 
 
 class PostgreSQLWrapper:
@@ -570,18 +771,167 @@ class PostgreSQLWrapper:
 
         :param uri: The database URI for connecting to PostgreSQL.
         :type uri: str
+        :param context_cache_size: The maximum number of context ids kept in memory by ``intern_contexts``.
+        :type context_cache_size: int
+        :param pool_size: The number of connections kept open in the pool.
+        :type pool_size: int
+        :param max_overflow: The number of connections allowed above ``pool_size``.
+        :type max_overflow: int
+        :param pool_timeout: The number of seconds to wait for a connection before giving up.
+        :type pool_timeout: float
+        :param pool_recycle: The number of seconds after which a connection is replaced, or -1 to never recycle.
+        :type pool_recycle: int
+        :param pool_pre_ping: Whether to test connections for liveness on checkout.
+        :type pool_pre_ping: bool
+        :param trust_schema: Whether to skip schema creation entirely. Otherwise tables are only created
+            when the database is not stamped with the current schema version.
+        :type trust_schema: bool
+        :param replica_uris: The database URIs of read replicas. Reads are sent to them when given.
+        :type replica_uris: list[str] | None
+        :param replica_selection: How a replica is picked for a read, 'round_robin' or 'least_loaded'.
+        :type replica_selection: str
+        :param read_your_writes: The number of seconds after a write during which reads made by the same
+            thread stay on the primary, or 0 to always read from replicas.
+        :type read_your_writes: float
+        :param profile_statements: Whether to record the latency and row count of every statement per method.
+        :type profile_statements: bool
+        :param slow_query_threshold: The number of seconds above which a profiled statement is logged.
+        :type slow_query_threshold: float
     """
 
-    def __init__(self, uri: str):
+    def __init__(self, uri: str, context_cache_size: int = 10000, pool_size: int = 5, max_overflow: int = 10,
+                 pool_timeout: float = 30, pool_recycle: int = -1, pool_pre_ping: bool = False,
+                 trust_schema: bool = False, replica_uris=None, replica_selection: str = 'round_robin',
+                 read_your_writes: float = 0, profile_statements: bool = False, slow_query_threshold: float = 1.0):
         """
             Initializes the PostgreSQLWrapper instance.
 
             :param uri: The database URI for connecting to PostgreSQL.
             :type uri: str
+            :param context_cache_size: The maximum number of context ids kept in memory by ``intern_contexts``.
+            :type context_cache_size: int
+            :param pool_size: The number of connections kept open in the pool.
+            :type pool_size: int
+            :param max_overflow: The number of connections allowed above ``pool_size``.
+            :type max_overflow: int
+            :param pool_timeout: The number of seconds to wait for a connection before giving up.
+            :type pool_timeout: float
+            :param pool_recycle: The number of seconds after which a connection is replaced, or -1 to never recycle.
+            :type pool_recycle: int
+            :param pool_pre_ping: Whether to test connections for liveness on checkout.
+            :type pool_pre_ping: bool
+            :param trust_schema: Whether to skip schema creation entirely. Otherwise tables are only created
+                when the database is not stamped with the current schema version.
+            :type trust_schema: bool
+            :param replica_uris: The database URIs of read replicas. Reads are sent to them when given.
+            :type replica_uris: list[str] | None
+            :param replica_selection: How a replica is picked for a read, 'round_robin' or 'least_loaded'.
+            :type replica_selection: str
+            :param read_your_writes: The number of seconds after a write during which reads made by the same
+                thread stay on the primary, or 0 to always read from replicas.
+            :type read_your_writes: float
+            :param profile_statements: Whether to record the latency and row count of every statement per method.
+            :type profile_statements: bool
+            :param slow_query_threshold: The number of seconds above which a profiled statement is logged.
+            :type slow_query_threshold: float
+            :raises ValueError: If the replica selection is unknown.
         """
-        self.engine = create_engine(uri)
+        if replica_selection not in ('round_robin', 'least_loaded'):
+            raise ValueError(f"Unknown replica selection: {replica_selection}")
+
+        self.engine, self.pool_monitor = create_monitored_engine(uri, pool_size=pool_size, max_overflow=max_overflow,
+                                                                 pool_timeout=pool_timeout, pool_recycle=pool_recycle,
+                                                                 pool_pre_ping=pool_pre_ping)
         self.Session = scoped_session(sessionmaker(bind=self.engine))
-        Base.metadata.create_all(self.engine)
+        self.context_cache = LRUCache(context_cache_size)
+        self._unit_of_work = threading.local()
+
+        self.replicas = []
+        for replica_uri in replica_uris or []:
+            engine, monitor = create_monitored_engine(replica_uri, pool_size=pool_size, max_overflow=max_overflow,
+                                                      pool_timeout=pool_timeout, pool_recycle=pool_recycle,
+                                                      pool_pre_ping=pool_pre_ping)
+            self.replicas.append((engine, monitor, scoped_session(sessionmaker(bind=engine))))
+        self.replica_selection = replica_selection
+        self.read_your_writes = read_your_writes
+        self._next_replica = itertools.count()
+        self._last_write = threading.local()
+
+        self.profiler = None
+        if profile_statements:
+            self.profiler = StatementProfiler(slow_query_threshold)
+            for engine in [self.engine] + [replica[0] for replica in self.replicas]:
+                self.profiler.attach(engine, self)
+
+        self._lazy_loads = threading.local()
+        for sessions in [self.Session] + [replica[2] for replica in self.replicas]:
+            event.listen(sessions.session_factory, 'do_orm_execute', self._on_orm_execute)
+
+        if not trust_schema:
+            ensure_schema(self.engine, Base.metadata)
+
+    def add_missing_columns(self):
+        """
+            Adds the columns that are declared on the models but missing from the database.
+
+            This is the migration step for columns added to tables that already exist, e.g.
+            UserMessages.queued_at, Contexts.digest and Report.result. It must run before the
+            models are queried on an upgraded database, followed by ``backfill_digests`` and
+            ``create_indexes``.
+
+            :return: The added columns, as 'table.column'.
+            :rtype: list[str]
+        """
+        return add_missing_columns(self.engine, Base.metadata)
+
+    def backfill_digests(self, batch_size=1000):
+        """
+            Computes the digest of the Contexts and ContextsOriginal rows that have none.
+
+            This is the migration step for contexts stored before the digest column existed. It
+            runs after ``add_missing_columns`` and before ``create_indexes``, and commits every
+            batch, so it can be interrupted and run again.
+
+            :param batch_size: The number of rows updated per transaction.
+            :type batch_size: int
+            :return: The number of rows updated, per table name.
+            :rtype: dict
+            :raises Exception: If there is an error during the operation.
+        """
+        counts = {}
+        for model in (Contexts, ContextsOriginal):
+            counts[model.__tablename__] = 0
+            session = self.get_session()
+            try:
+                while True:
+                    rows = session.execute(
+                        select(model.id, model.text).where(model.digest.is_(None)).order_by(model.id).limit(batch_size)
+                    ).all()
+                    if not rows:
+                        break
+                    session.execute(update(model), [{'id': id, 'digest': text_digest(text)} for id, text in rows])
+                    session.commit()
+                    counts[model.__tablename__] += len(rows)
+            except Exception as e:
+                session.rollback()
+                raise e
+            finally:
+                session.close()
+        return counts
+
+    def create_indexes(self):
+        """
+            Creates the indexes that are declared on the models but missing from the database.
+
+            This is the migration step for indexes added to tables that already exist, which schema
+            creation on startup leaves alone. Indexes are built concurrently, without blocking writes.
+            An index that fails to build, e.g. a unique index over duplicate rows, is logged and
+            skipped, so the duplicates must be removed first, see the README.
+
+            :return: The names of the created indexes, without the ones that failed to build.
+            :rtype: list[str]
+        """
+        return create_indexes(self.engine, Base.metadata)
 
     def get_session(self):
         """
@@ -592,24 +942,268 @@ class PostgreSQLWrapper:
         """
         return self.Session()
 
+    @contextmanager
+    def unit_of_work(self, detached=False):
+        """
+            Opens a unit of work scope around the thread's session.
+
+            Every wrapper call made inside the scope shares one session and one transaction, which
+            is committed when the scope exits and rolled back if it raises. The session is then
+            closed and removed, so the identity map never outlives the scope. Scopes may be nested;
+            only the outermost one commits. Wrapper calls, reads included, and nested scopes that fail inside
+            the scope raise and mark it rollback-only: even if the error is caught, the scope rolls back
+            instead of committing.
+
+            example
+                with wrapper.unit_of_work():
+                    wrapper.add(message)
+                    wrapper.addToM2mTables(model_name=user_message_keyword, keyword_id=1, user_message_id=message.id)
+
+            :param detached: Whether instances loaded in the scope keep their loaded attributes after it exits,
+                instead of being expired by the commit.
+            :type detached: bool
+            :return: The session used by the scope.
+            :rtype: Session
+            :raises RollbackOnlyError: If a wrapper call failed in the scope and the error was caught.
+            :raises Exception: If there is an error during the operation.
+        """
+        depth = getattr(self._unit_of_work, 'depth', 0)
+        session = self.get_session()
+        if depth == 0:
+            self._unit_of_work.rollback_only = False
+        self._unit_of_work.depth = depth + 1
+        try:
+            yield session
+            if depth == 0:
+                if self._unit_of_work.rollback_only:
+                    raise RollbackOnlyError("A wrapper call failed in the unit of work, so it was rolled back")
+                session.expire_on_commit = not detached
+                session.commit()
+        except Exception as e:
+            if depth == 0:
+                session.rollback()
+            else:
+                self._unit_of_work.rollback_only = True
+            raise e
+        finally:
+            self._unit_of_work.depth = depth
+            if depth == 0:
+                session.close()
+                self.Session.remove()
+
+    @contextmanager
+    def detect_n_plus_one(self, threshold=10, action='log'):
+        """
+            Counts the lazy loads made by the calling thread in the scope, per relationship, to find N+1 queries.
+
+            Once a relationship is lazy loaded more than ``threshold`` times in the scope, the call site is
+            reported, either as a logged warning or by raising NPlusOneError from the offending load.
+
+            example
+                with wrapper.detect_n_plus_one(threshold=5, action='raise') as lazy_loads:
+                    for message in wrapper.query_all(UserMessages):
+                        message.keywords
+
+            :param threshold: The number of lazy loads of a single relationship allowed in the scope.
+            :type threshold: int
+            :param action: What to do when the threshold is exceeded, 'log' or 'raise'.
+            :type action: str
+            :return: The number of lazy loads per relationship, updated as the scope runs.
+            :rtype: Counter
+            :raises ValueError: If the action is unknown.
+        """
+        if action not in ('log', 'raise'):
+            raise ValueError(f"Unknown N+1 action: {action}")
+
+        previous = getattr(self._lazy_loads, 'scope', None)
+        counts = Counter()
+        self._lazy_loads.scope = (counts, threshold, action)
+        try:
+            yield counts
+        finally:
+            self._lazy_loads.scope = previous
+
+    def _on_orm_execute(self, orm_execute_state):
+        """
+            Counts lazy loads for the N+1 detection scope of the calling thread, if one is open.
+
+            :param orm_execute_state: The state of the ORM statement being executed.
+            :type orm_execute_state: ORMExecuteState
+            :raises NPlusOneError: If the scope raises and a relationship exceeded its lazy load threshold.
+        """
+        scope = getattr(self._lazy_loads, 'scope', None)
+        if scope is None or orm_execute_state.lazy_loaded_from is None:
+            return
+
+        counts, threshold, action = scope
+        relationship_name = str(orm_execute_state.loader_strategy_path[-1])
+        counts[relationship_name] += 1
+        if counts[relationship_name] == threshold + 1:
+            message = f"N+1 lazy loads of {relationship_name}: more than {threshold} in one scope"
+            if action == 'raise':
+                raise NPlusOneError(message)
+            logger.warning(message)
+
+    def _commit(self, session):
+        """
+            Commits the session, or only flushes it while a unit of work scope is open.
+
+            :param session: The SQLAlchemy session to commit.
+            :type session: Session
+        """
+        if getattr(self._unit_of_work, 'depth', 0):
+            session.flush()
+        else:
+            session.commit()
+        self._last_write.at = time.monotonic()
+
+    def _rollback(self, session):
+        """
+            Rolls back the session, or marks the open unit of work scope rollback-only.
+
+            Inside a scope the transaction is shared with the calls made before, so it is left to
+            the outermost scope to roll back.
+
+            :param session: The SQLAlchemy session to roll back.
+            :type session: Session
+            :return: Whether a unit of work scope is open, in which case the error must be raised.
+            :rtype: bool
+        """
+        if getattr(self._unit_of_work, 'depth', 0):
+            self._unit_of_work.rollback_only = True
+            return True
+        session.rollback()
+        return False
+
+    def _read_sessions(self):
+        """
+            Returns the session registry that reads should use.
+
+            Reads go to a replica unless there is none, a unit of work scope is open or the thread
+            wrote to the primary within the read-your-writes window.
+
+            :return: The scoped session registry of the primary or of the selected replica.
+            :rtype: scoped_session
+        """
+        if not self.replicas or getattr(self._unit_of_work, 'depth', 0):
+            return self.Session
+        if time.monotonic() - getattr(self._last_write, 'at', float('-inf')) < self.read_your_writes:
+            return self.Session
+
+        if self.replica_selection == 'least_loaded':
+            return min(self.replicas, key=lambda replica: replica[0].pool.checkedout())[2]
+        return self.replicas[next(self._next_replica) % len(self.replicas)][2]
+
+    def _read_engine(self):
+        """
+            Returns the engine that reads outside of the ORM should use.
+
+            :return: The engine of the primary or of the selected replica.
+            :rtype: Engine
+        """
+        return self._read_sessions().session_factory.kw['bind']
+
+    @contextmanager
+    def _read_session(self):
+        """
+            Provides the session that reads should use.
+
+            Reads on the primary use its scoped session. Reads on a replica use a short-lived
+            session that is closed afterwards, so its connection goes back to the pool and no
+            snapshot or identity map outlives the read. Instances it returns are detached.
+
+            :return: A session on the primary or on the selected replica.
+            :rtype: Session
+        """
+        sessions = self._read_sessions()
+        if sessions is self.Session:
+            yield sessions()
+            return
+
+        session = sessions.session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def pool_stats(self):
+        """
+            Returns a snapshot of the connection pool statistics.
+
+            :return: The pool size, checked out and overflow connections, checkout wait times and connection ages,
+                with the same statistics for every replica under 'replicas'.
+            :rtype: dict
+        """
+        stats = self.pool_monitor.stats(self.engine.pool)
+        if self.replicas:
+            stats['replicas'] = [monitor.stats(engine.pool) for engine, monitor, _ in self.replicas]
+        return stats
+
+    def statement_stats(self):
+        """
+            Returns the aggregated statistics of the statements issued by every method.
+
+            :return: The number of statements, rows and slow statements and the latency percentiles per method,
+                or an empty dict when statements are not profiled.
+            :rtype: dict
+        """
+        return self.profiler.stats() if self.profiler else {}
+
     def add(self, instance):
         """
             Adds a new instance to the database and commits the transaction.
 
             :param instance: The instance to be added to the database.
             :type instance: Base
-            :return: The added instance with updated attributes.
+            :return: The added instance with updated attributes. An instance still attached to another session,
+                e.g. one read from a replica, is merged and its merged copy is returned.
             :rtype: Base
             :raises Exception: If there is an error during the operation.
         """
         session = self.get_session()
         try:
+            if object_session(instance) not in (None, session):
+                instance = session.merge(instance)
             session.add(instance)
-            session.commit()
+            self._commit(session)
             session.refresh(instance)
             return instance
         except Exception as e:
-            session.rollback()
+            self._rollback(session)
+            raise e
+
+    def add_many(self, model, rows, chunk_size=1000):
+        """
+            Adds many rows of a model in a single transaction using multi-row INSERT ... RETURNING.
+
+            Rows are sent in chunks of ``chunk_size`` and the generated primary keys are
+            returned in the same order as the input rows.
+
+            :param model: The model class to insert into.
+            :type model: Base
+            :param rows: A list of dictionaries mapping attribute names to values.
+            :type rows: list[dict]
+            :param chunk_size: The maximum number of rows sent per INSERT statement.
+            :type chunk_size: int
+            :return: The primary keys of the inserted rows, in input order.
+            :rtype: list
+            :raises Exception: If there is an error during the operation.
+        """
+        if not rows:
+            return []
+
+        primary_key = model.__mapper__.primary_key[0]
+        session = self.get_session()
+        try:
+            ids = []
+            for start in range(0, len(rows), chunk_size):
+                stmt = insert(model).returning(primary_key, sort_by_parameter_order=True)
+                result = session.execute(stmt, rows[start:start + chunk_size])
+                ids.extend(result.scalars().all())
+            self._commit(session)
+            return ids
+        except Exception as e:
+            self._rollback(session)
             raise e
 
     def addToM2mTables(self, *, model_name: Table, **kwargs):
@@ -627,12 +1221,125 @@ class PostgreSQLWrapper:
             query = insert(model_name).values(**kwargs).on_conflict_do_nothing(
                 index_elements=kwargs.keys())
             session.execute(query)
-            session.commit()
+            self._commit(session)
             return True
         except Exception as e:
-            session.rollback()
+            self._rollback(session)
+            raise e
+
+    def addManyToM2mTables(self, links, chunk_size=1000):
+        """
+            Adds many rows to one or more many to many association tables in a single transaction.
+
+            Each table gets one INSERT per chunk of rows, and links that already exist are skipped:
+            with ``ON CONFLICT DO NOTHING`` when the table has a unique constraint on the linked
+            columns, otherwise with ``WHERE NOT EXISTS`` against the table, the chunk being
+            deduplicated first.
+
+            example addManyToM2mTables({user_message_keyword: [{'keyword_id': 1, 'user_message_id': 7}],
+                                        topics_userMessages_association: [{'topic_id': 2, 'user_message_id': 7}]})
+
+            :param links: A dictionary mapping association tables to lists of rows to insert.
+            :type links: dict[Table, list[dict]]
+            :param chunk_size: The maximum number of rows sent per INSERT statement.
+            :type chunk_size: int
+            :return: The number of links actually created.
+            :rtype: int
+            :raises Exception: If there is an error during the operation.
+        """
+        session = self.get_session()
+        try:
+            created = 0
+            for table, rows in links.items():
+                for start in range(0, len(rows), chunk_size):
+                    created += session.execute(self._insert_links(table, rows[start:start + chunk_size])).rowcount
+            self._commit(session)
+            return created
+        except Exception as e:
+            self._rollback(session)
             raise e
 
+    @staticmethod
+    def _insert_links(table, rows):
+        """
+            Builds the INSERT of association rows that skips the links already in the table.
+
+            :param table: The association table.
+            :type table: Table
+            :param rows: The rows to insert, all with the same columns.
+            :type rows: list[dict]
+            :return: The insert statement.
+            :rtype: Insert
+        """
+        names = list(rows[0])
+        if any({column.name for column in constraint.columns} <= set(names)
+               for constraint in table.constraints if isinstance(constraint, UniqueConstraint)):
+            return insert(table).values(rows).on_conflict_do_nothing()
+
+        links = values(*[column(name, table.c[name].type) for name in names], name='links') \
+            .data([tuple(row[name] for name in names) for row in rows])
+        existing = select(table.c.id).where(*[table.c[name] == links.c[name] for name in names])
+        return insert(table).from_select(names, select(*links.c).distinct().where(~existing.exists()))
+
+    def intern_contexts(self, project_id, texts, model=Contexts):
+        """
+            Gets or creates context rows for a list of texts and returns their ids.
+
+            Contexts are identified by the SHA-256 digest of their text, so only digests are
+            compared in the database. Ids are remembered in a bounded in-process LRU cache once
+            they are committed, and texts seen before are resolved without a round trip.
+
+            :param project_id: The project the contexts belong to. It is required, since the unique index on
+                (project_id, digest) does not deduplicate contexts without a project.
+            :type project_id: int
+            :param texts: The context texts.
+            :type texts: list[str]
+            :param model: The context model, Contexts or ContextsOriginal.
+            :type model: Base
+            :return: The context ids, in the same order as ``texts``.
+            :rtype: list[int]
+            :raises ValueError: If the project id is None.
+            :raises Exception: If there is an error during the operation.
+        """
+        if project_id is None:
+            raise ValueError("Contexts can only be interned within a project")
+
+        digests = [text_digest(text) for text in texts]
+        ids = {}
+        missing = {}
+
+        for digest, text in zip(digests, texts):
+            context_id = self.context_cache.get((model.__tablename__, project_id, digest))
+            if context_id is not None:
+                ids[digest] = context_id
+            else:
+                missing[digest] = text
+
+        if missing:
+            session = self.get_session()
+            try:
+                query = insert(model).values(
+                    [{'project_id': project_id, 'text': text, 'digest': digest} for digest, text in missing.items()]
+                ).on_conflict_do_nothing(index_elements=['project_id', 'digest'])
+                session.execute(query)
+                rows = session.execute(
+                    select(model.digest, model.id)
+                    .where(model.project_id == project_id, model.digest.in_(list(missing)))
+                ).all()
+                self._commit(session)
+            except Exception as e:
+                self._rollback(session)
+                raise e
+
+            for digest, context_id in rows:
+                ids[digest] = context_id
+            # Inside a unit of work the rows are only flushed and may still be rolled back
+            if not getattr(self._unit_of_work, 'depth', 0):
+                for digest in missing:
+                    self.context_cache.put((model.__tablename__, project_id, digest), ids[digest])
+
+        return [ids[digest] for digest in digests]
+
     @staticmethod
     def add_without_commit(instance, session):
         """
@@ -659,26 +1366,37 @@ class PostgreSQLWrapper:
 
             :param model: The model class to query.
             :type model: Base
-            :param relationship_fields: A list of relationship fields to apply eager loading.
-            :type relationship_fields: list[str] | None
+            :param relationship_fields: A list of relationship fields to load with joined eager loading, or a
+                dictionary mapping relationship fields to their loading strategy: 'joined', 'selectin',
+                'subquery', 'lazy' or 'raise'. Fields are relationship attributes or their names.
+            :type relationship_fields: list | dict | None
             :return: A list of queried instances.
             :rtype: list[Base]
-            :raises Exception: If there is an error during the operation.
+            :raises ValueError: If a loading strategy is unknown.
         """
-        session = self.get_session()
-        try:
-            query = session.query(model)
-
-            # Apply eager loading for the specified relationship fields
-            if relationship_fields:
-                for field in relationship_fields:
-                    query = query.options(joinedload(field))  # or subqueryload(field)
-
-            result = query.all()
-            return result
-        except Exception as e:
-            print(f"Error querying all instances: {e}")
-            return []
+        if relationship_fields and not isinstance(relationship_fields, dict):
+            relationship_fields = dict.fromkeys(relationship_fields, 'joined')
+        for strategy in (relationship_fields or {}).values():
+            if strategy not in LOADER_STRATEGIES:
+                raise ValueError(f"Unknown loading strategy: {strategy}")
+
+        with self._read_session() as session:
+            try:
+                query = session.query(model)
+
+                # Apply the loading strategy for the specified relationship fields
+                if relationship_fields:
+                    for field, strategy in relationship_fields.items():
+                        field = getattr(model, field) if isinstance(field, str) else field
+                        query = query.options(LOADER_STRATEGIES[strategy](field))
+
+                result = query.all()
+                return result
+            except Exception as e:
+                if self._rollback(session):
+                    raise e
+                print(f"Error querying all instances: {e}")
+                return []
 
     def query_by_id(self, model, id):
         """
@@ -692,13 +1410,15 @@ class PostgreSQLWrapper:
             :rtype: Base | None
             :raises Exception: If there is an error during the operation.
         """
-        session = self.get_session()
-        try:
-            result = session.get(model, id)
-            return result
-        except Exception as e:
-            print(f"Error querying instance by ID: {e}")
-            return None
+        with self._read_session() as session:
+            try:
+                result = session.get(model, id)
+                return result
+            except Exception as e:
+                if self._rollback(session):
+                    raise e
+                print(f"Error querying instance by ID: {e}")
+                return None
 
     def update(self, instance):
         """
@@ -711,11 +1431,47 @@ class PostgreSQLWrapper:
         session = self.get_session()
         try:
             session.merge(instance)
-            session.commit()
+            self._commit(session)
         except Exception as e:
-            session.rollback()
+            if self._rollback(session):
+                raise e
             print(f"Error updating instance: {e}")
 
+    def update_many(self, model, updates, chunk_size=1000):
+        """
+            Updates many rows of a model by primary key in a single transaction.
+
+            Rows are written with ORM bulk UPDATE by primary key, an executemany without the
+            SELECT that ``update`` issues through merge. Rows updating the same set of columns
+            share a statement, e.g. when writing classifier metrics back to UserMessages or Chat.
+
+            example update_many(UserMessages, [(1, {'helpfulness': HelpfulnessEnum.HELPFUL,
+                                                    'sentiment': SentimentEnum.POSITIVE})])
+
+            :param model: The model class to update.
+            :type model: Base
+            :param updates: A list of (primary key, {column name: value}) pairs.
+            :type updates: list[tuple[Any, dict]]
+            :param chunk_size: The maximum number of rows sent per executemany.
+            :type chunk_size: int
+            :raises Exception: If there is an error during the operation.
+        """
+        primary_key = model.__mapper__.primary_key[0].key
+        rows = [{**values, primary_key: id} for id, values in updates]
+        if model in (Contexts, ContextsOriginal):
+            # Bulk updates skip the ORM events that keep the digest in sync with the text
+            for row in rows:
+                if 'text' in row:
+                    row['digest'] = text_digest(row['text'])
+        session = self.get_session()
+        try:
+            for start in range(0, len(rows), chunk_size):
+                session.execute(update(model), rows[start:start + chunk_size])
+            self._commit(session)
+        except Exception as e:
+            self._rollback(session)
+            raise e
+
     def delete(self, instance):
         """
             Deletes an instance from the database.
@@ -726,56 +1482,379 @@ class PostgreSQLWrapper:
         """
         session = self.get_session()
         try:
+            if object_session(instance) not in (None, session):
+                instance = session.merge(instance)
             session.delete(instance)
-            session.commit()
+            self._commit(session)
         except Exception as e:
-            session.rollback()
+            if self._rollback(session):
+                raise e
             print(f"Error deleting instance: {e}")
 
+    def claim_batch(self, model, n, reclaim_after=None):
+        """
+            Atomically claims up to n waiting rows of a work queue model for the calling worker.
+
+            Rows are picked in primary key order with ``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent
+            workers never claim the same row or wait on each other's locks. Claimed Chat rows move
+            from unprocessed to queued, claimed UserMessages rows get their queued_at time set.
+
+            A row claimed by a worker that died is never completed. UserMessages rows claimed more
+            than ``reclaim_after`` seconds ago can be claimed again. Chat claims are not timed, so
+            queued chats of a dead worker stay queued until their status is reset to unprocessed.
+
+            :param model: The work queue model, Chat or UserMessages.
+            :type model: Base
+            :param n: The maximum number of rows to claim.
+            :type n: int
+            :param reclaim_after: The number of seconds after which uncompleted claims are claimed again,
+                or None to never claim a row twice.
+            :type reclaim_after: float | None
+            :return: The claimed instances, detached with their claimed values loaded unless a unit of
+                work scope is open.
+            :rtype: list[Base]
+            :raises ValueError: If claims of the model are not timed and reclaim_after is set.
+            :raises Exception: If there is an error during the operation.
+        """
+        queue = WORK_QUEUES[model]
+        condition = queue['pending']
+        if reclaim_after is not None:
+            if queue['stale'] is None:
+                raise ValueError(f"Claims of {model.__name__} rows are not timed and cannot be reclaimed")
+            condition = or_(condition, queue['stale'](func.now() - timedelta(seconds=reclaim_after)))
+
+        primary_key = model.__mapper__.primary_key[0]
+        session = self.get_session()
+        try:
+            pending = select(primary_key).where(condition).order_by(primary_key).limit(n) \
+                .with_for_update(skip_locked=True)
+            stmt = update(model).where(primary_key.in_(pending)).values(**queue['claim']).returning(model) \
+                .execution_options(synchronize_session=False)
+            result = session.execute(stmt).scalars().all()
+            if not getattr(self._unit_of_work, 'depth', 0):
+                # Detach the claimed rows so that the commit does not expire them
+                for instance in result:
+                    session.expunge(instance)
+            self._commit(session)
+            return result
+        except Exception as e:
+            self._rollback(session)
+            raise e
+
+    def complete_batch(self, model, ids):
+        """
+            Marks claimed rows of a work queue model as processed.
+
+            :param model: The work queue model, Chat or UserMessages.
+            :type model: Base
+            :param ids: The primary keys of the rows to complete.
+            :type ids: list
+            :return: The number of rows completed.
+            :rtype: int
+            :raises Exception: If there is an error during the operation.
+        """
+        primary_key = model.__mapper__.primary_key[0]
+        session = self.get_session()
+        try:
+            stmt = update(model).where(primary_key.in_(ids)).values(**WORK_QUEUES[model]['complete']) \
+                .execution_options(synchronize_session=False)
+            count = session.execute(stmt).rowcount
+            self._commit(session)
+            return count
+        except Exception as e:
+            self._rollback(session)
+            raise e
+
     def find_by_fields(self, model, filters):
         """
             Finds instances based on specified field filters.
 
             :param model: The model class to query.
             :type model: Base
-            :param filters: A dictionary of field filters. Each filter is a dictionary with 'field_name', 'operator', and 'value'.
+            :param filters: A dictionary of field filters. Each filter is a dictionary with 'operator' and 'value'.
+                Supported operators are ==, !=, >, >=, <, <=, like, ilike, in, not_in, between (value is a
+                (lower, upper) pair), is_null (value is True or False) and contains (a
+                list of elements for array columns, a substring otherwise).
             :type filters: dict
             :return: A list of instances matching the filters.
             :rtype: list[Base]
+            :raises ValueError: If a filter uses an unsupported operator.
+        """
+        shape, params = self._filter_shape(filters)
+        with self._read_session() as session:
+            try:
+                result = session.execute(_filter_statement(model, shape), params).scalars().all()
+                return result
+            except Exception as e:
+                if self._rollback(session):
+                    raise e
+                print(f"Error finding instances with filters {filters}: {e}")
+                return []
+
+    @staticmethod
+    def _filter_shape(filters):
+        """
+            Splits field filters into their shape, which the compiled statements are cached by, and the values to bind.
+
+            :param filters: A dictionary of field filters. Each filter is a dictionary with 'operator' and 'value'.
+            :type filters: dict
+            :return: The filter shape and its bound parameter values.
+            :rtype: tuple[tuple, dict]
+            :raises ValueError: If a filter uses an unsupported operator.
+        """
+        shape = []
+        params = {}
+
+        for position, (field_name, condition) in enumerate(filters.items()):
+            operator = condition.get("operator", "==")
+            value = condition.get("value")
+            name = f"{field_name}_{position}"
+
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            if operator in ("==", "!=") and value is None:
+                operator, value = "is_null", operator == "=="
+
+            if operator == "is_null":
+                shape.append((field_name, operator, bool(value)))
+                continue
+
+            shape.append((field_name, operator, None))
+            if operator == "between":
+                params[f"{name}_lower"], params[f"{name}_upper"] = value
+            else:
+                params[name] = value
+
+        return tuple(shape), params
+
+    def select_columns(self, model, columns, filters=None, row_type='tuple'):
+        """
+            Queries only the given columns of a model, returning lightweight rows instead of ORM instances.
+
+            Rows are plain column values without identity map tracking, so they cost a fraction of
+            loading full instances when only a few columns are needed, e.g. for exports.
+
+            example select_columns(UserMessages, ['id', 'question', 'date', 'sentiment'],
+                                   {'project_id': {'value': 1}}, row_type='dict')
+
+            :param model: The model class to query.
+            :type model: Base
+            :param columns: The names of the columns to select.
+            :type columns: list[str]
+            :param filters: A dictionary of field filters, as accepted by ``find_by_fields``.
+            :type filters: dict | None
+            :param row_type: The type of the returned rows: 'tuple', 'namedtuple' or 'dict'.
+            :type row_type: str
+            :return: A list of rows matching the filters.
+            :rtype: list[tuple] | list[Row] | list[dict]
+            :raises ValueError: If the row type is unknown or a filter uses an unsupported operator.
+        """
+        if row_type not in ('tuple', 'namedtuple', 'dict'):
+            raise ValueError(f"Unknown row type: {row_type}")
+
+        shape, params = self._filter_shape(filters or {})
+        with self._read_session() as session:
+            try:
+                stmt = select(*[getattr(model, name) for name in columns]).where(_compile_filter_clause(model, shape))
+                result = session.execute(stmt, params)
+
+                if row_type == 'dict':
+                    return [dict(row) for row in result.mappings()]
+                if row_type == 'tuple':
+                    return [tuple(row) for row in result]
+                return result.all()
+            except Exception as e:
+                if self._rollback(session):
+                    raise e
+                print(f"Error selecting columns {columns} with filters {filters}: {e}")
+                return []
+
+    def stream_all(self, model, chunk_size=1000):
+        """
+            Streams all instances of a model using a server-side cursor.
+
+            Rows are fetched ``chunk_size`` at a time and every chunk is expunged from its
+            session before it is yielded, so memory stays flat regardless of table size.
+            Yielded instances are detached and cannot lazy load relationships.
+
+            :param model: The model class to query.
+            :type model: Base
+            :param chunk_size: The number of rows fetched per round trip.
+            :type chunk_size: int
+            :return: A generator of queried instances.
+            :rtype: Iterator[Base]
             :raises Exception: If there is an error during the operation.
         """
-        session = self.get_session()
+        yield from self._stream(select(model), chunk_size)
+
+    def stream_by_fields(self, model, filters, chunk_size=1000):
+        """
+            Streams instances matching the specified field filters using a server-side cursor.
+
+            Accepts the same filters as ``find_by_fields``. Yielded instances are detached.
+
+            :param model: The model class to query.
+            :type model: Base
+            :param filters: A dictionary of field filters. Each filter is a dictionary with 'operator' and 'value'.
+            :type filters: dict
+            :param chunk_size: The number of rows fetched per round trip.
+            :type chunk_size: int
+            :return: A generator of instances matching the filters.
+            :rtype: Iterator[Base]
+            :raises Exception: If there is an error during the operation.
+        """
+        shape, params = self._filter_shape(filters)
+        yield from self._stream(_filter_statement(model, shape), chunk_size, params)
+
+    def _stream(self, stmt, chunk_size, params=None):
+        """
+            Executes a select on a dedicated session and yields its entities chunk by chunk.
+
+            :param stmt: The select statement to execute.
+            :type stmt: Select
+            :param chunk_size: The number of rows fetched per round trip.
+            :type chunk_size: int
+            :param params: The bound parameter values for the statement.
+            :type params: dict | None
+            :return: A generator of detached instances.
+            :rtype: Iterator[Base]
+        """
+        session = self._read_sessions().session_factory()
         try:
-            query = session.query(model)
-            filter_conditions = []
-
-            for field_name, condition in filters.items():
-                field = getattr(model, field_name)
-                operator = condition.get("operator", "==")
-                value = condition["value"]
-
-                if operator == "==":
-                    filter_conditions.append(field == value)
-                elif operator == "!=":
-                    filter_conditions.append(field != value)
-                elif operator == ">":
-                    filter_conditions.append(field > value)
-                elif operator == ">=":
-                    filter_conditions.append(field >= value)
-                elif operator == "<":
-                    filter_conditions.append(field < value)
-                elif operator == "<=":
-                    filter_conditions.append(field <= value)
-                elif operator == "like":
-                    filter_conditions.append(field.like(value))
-                elif operator == "in":
-                    filter_conditions.append(field.in_(value))
-
-            result = query.filter(and_(*filter_conditions)).all()
-            return result
-        except Exception as e:
-            print(f"Error finding instances with filters {filters}: {e}")
-            return []
+            result = session.execute(stmt.execution_options(yield_per=chunk_size), params)
+            for partition in result.scalars().partitions():
+                for instance in partition:
+                    session.expunge(instance)
+                yield from partition
+        finally:
+            session.close()
+
+    def find_page(self, model, filters=None, order_by=('id',), page_size=50, cursor=None, descending=False):
+        """
+            Finds one page of instances using keyset (cursor) pagination.
+
+            The page starts right after the row encoded in ``cursor`` and is found with a row
+            comparison on the ordering columns, so an index on those columns serves every
+            page at the same cost. The ordering columns must be unique together, e.g.
+            ('id',) or ('date', 'id').
+
+            :param model: The model class to query.
+            :type model: Base
+            :param filters: A dictionary of field filters, as accepted by ``find_by_fields``.
+            :type filters: dict | None
+            :param order_by: The names of the ordering columns.
+            :type order_by: tuple[str]
+            :param page_size: The maximum number of instances on the page.
+            :type page_size: int
+            :param cursor: The cursor returned with the previous page, or None for the first page.
+            :type cursor: str | None
+            :param descending: Whether to page in descending order.
+            :type descending: bool
+            :return: The instances on the page and the cursor for the next page, or None if this is the last page.
+            :rtype: tuple[list[Base], str | None]
+            :raises Exception: If there is an error during the operation.
+        """
+        columns = [getattr(model, name) for name in order_by]
+        shape, params = self._filter_shape(filters or {})
+        with self._read_session() as session:
+            query = session.query(model).filter(_compile_filter_clause(model, shape)).params(params)
+
+            if cursor is not None:
+                key = tuple_(*columns)
+                values = tuple_(*self._decode_cursor(cursor, columns))
+                query = query.filter(key < values if descending else key > values)
+
+            query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+            result = query.limit(page_size + 1).all()
+
+        if len(result) <= page_size:
+            return result, None
+
+        result = result[:page_size]
+        return result, self._encode_cursor([getattr(result[-1], name) for name in order_by])
+
+    @staticmethod
+    def _encode_cursor(values):
+        """
+            Encodes the ordering values of the last row on a page into an opaque cursor.
+
+            :param values: The ordering values.
+            :type values: list
+            :return: The cursor token.
+            :rtype: str
+        """
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor, columns):
+        """
+            Decodes a cursor produced by ``_encode_cursor`` back into ordering values.
+
+            :param cursor: The cursor token.
+            :type cursor: str
+            :param columns: The ordering columns the cursor was built from.
+            :type columns: list
+            :return: The ordering values.
+            :rtype: list
+            :raises ValueError: If the cursor does not match the ordering columns.
+        """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(f"Invalid cursor: {cursor}")
+
+        return [datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+                for column, value in zip(columns, values)]
+
+    def export_dataset(self, dataset_id, out, format='csv', sets=None):
+        """
+            Streams the messages of a dataset into a file-like object using ``COPY ... TO STDOUT``.
+
+            The rows never become ORM objects; PostgreSQL writes them straight into ``out`` as CSV
+            with a header row, or as one JSON document per line, so the export runs in constant memory.
+
+            :param dataset_id: The ID of the dataset to export.
+            :type dataset_id: int
+            :param out: The file-like object the export is written to, in text or binary mode.
+            :param format: The export format, 'csv' or 'jsonl'.
+            :type format: str
+            :param sets: Only export messages belonging to these augmentation sets.
+            :type sets: list[AugmentSetEnum] | None
+            :return: The number of exported messages.
+            :rtype: int
+            :raises ValueError: If the format is unknown.
+            :raises Exception: If there is an error during the operation.
+        """
+        if format not in ('csv', 'jsonl'):
+            raise ValueError(f"Unknown export format: {format}")
+
+        # The set column stores enum names; export the same values the ORM exposes.
+        augment_set = case({member.name: member.value for member in AugmentSetEnum}, value=DatasetMessage.set)
+        stmt = select(DatasetMessage.query, DatasetMessage.answer, DatasetMessage.gt_answer,
+                      DatasetMessage.expert_response, DatasetMessage.context, augment_set.label('set')) \
+            .join(datasetMessage_dataset_association,
+                  datasetMessage_dataset_association.c.dataset_message_id == DatasetMessage.id) \
+            .where(datasetMessage_dataset_association.c.dataset_id == dataset_id)
+        if sets:
+            stmt = stmt.where(DatasetMessage.set.in_(sets))
+
+        if format == 'csv':
+            sql = f"COPY ({compile_literal(stmt)}) TO STDOUT WITH ({CSV_OPTIONS})"
+        else:
+            sql = f"COPY (SELECT row_to_json(messages) FROM ({compile_literal(stmt)}) messages) " \
+                  f"TO STDOUT WITH ({JSONL_OPTIONS})"
+
+        connection = self._read_engine().raw_connection()
+        try:
+            count = copy_to(connection.driver_connection, sql, out)
+            connection.commit()
+            return count
+        finally:
+            connection.close()
 
     def update_many_to_many(self, association, field: str, change: dict):
         """
@@ -803,6 +1882,55 @@ class PostgreSQLWrapper:
             session.execute(stmt)
 
             # Commit the transaction to save changes
-            session.commit()
+            self._commit(session)
         except Exception as e:
+            if self._rollback(session):
+                raise e
             print(f"An error occurred: {e}")
+
+    def remap_many_to_many(self, association, field: str, mapping: dict):
+        """
+        Remaps many values of a many-to-many association field at once, e.g. when merging issues or topics.
+
+        The whole mapping is sent as a VALUES list: one DELETE removes the links the remap would
+        duplicate, keeping the oldest, and one UPDATE joined against the mapping moves the rest.
+        Both run in a single transaction. The mapping is applied once, not transitively.
+
+        Parameters:
+        - association: The association table to update.
+        - field: The name of the many-to-many relationship field.
+        - mapping: A dictionary where keys are the current values and values are the new values.
+
+        Returns the number of affected rows, removed duplicates included.
+
+        example remap_many_to_many(association=feedbacks_issues_association, field="issue_id", mapping={3: 4, 5: 4})
+        """
+        if not mapping:
+            return 0
+
+        link_column = association.c[field]
+        others = [c for c in association.c if not c.primary_key and c is not link_column]
+        primary_key = association.primary_key.columns.values()[0]
+        remap = values(column('old_id', link_column.type), column('new_id', link_column.type),
+                       name='mapping').data(list(mapping.items()))
+
+        target = func.coalesce(remap.c.new_id, link_column)
+        links = select(primary_key.label('id'),
+                       func.row_number().over(partition_by=[target, *others], order_by=primary_key).label('rank')) \
+            .select_from(association.outerjoin(remap, link_column == remap.c.old_id)) \
+            .where(link_column.in_(set(mapping) | set(mapping.values()))) \
+            .subquery()
+
+        session = self.get_session()
+        try:
+            deleted = session.execute(
+                delete(association).where(primary_key.in_(select(links.c.id).where(links.c.rank > 1)))
+            ).rowcount
+            updated = session.execute(
+                update(association).where(link_column == remap.c.old_id).values({field: remap.c.new_id})
+            ).rowcount
+            self._commit(session)
+            return deleted + updated
+        except Exception as e:
+            self._rollback(session)
+            raise e
@@ -0,0 +1,189 @@
+from sqlalchemy import Table, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from connector.postgres.postgres import Base, PostgreSQLWrapper, _filter_statement
+from connector.postgres.schema import current_schema_version, create_schema, schema_fingerprint
+
+
+class AsyncPostgreSQLWrapper:
+    """
+        An asyncio counterpart of PostgreSQLWrapper built on SQLAlchemy's async engine.
+
+        This class offers the same adding, querying and many to many methods as PostgreSQLWrapper
+        over the same models, awaiting the database instead of blocking the event loop. Every call
+        runs in its own AsyncSession, and instances keep their attributes after commit since they
+        cannot lazy load outside of a session.
+
+        The asyncpg driver is an optional dependency, installed with the ``async`` extra.
+
+        :param uri: The database URI for connecting to PostgreSQL, using an async driver
+            (e.g. postgresql+asyncpg://).
+        :type uri: str
+        :param pool_size: The number of connections kept open in the pool.
+        :type pool_size: int
+        :param max_overflow: The number of connections allowed above ``pool_size``.
+        :type max_overflow: int
+        :param pool_timeout: The number of seconds to wait for a connection before giving up.
+        :type pool_timeout: float
+        :param pool_recycle: The number of seconds after which a connection is replaced, or -1 to never recycle.
+        :type pool_recycle: int
+        :param pool_pre_ping: Whether to test connections for liveness on checkout.
+        :type pool_pre_ping: bool
+    """
+
+    def __init__(self, uri: str, pool_size: int = 5, max_overflow: int = 10, pool_timeout: float = 30,
+                 pool_recycle: int = -1, pool_pre_ping: bool = False):
+        """
+            Initializes the AsyncPostgreSQLWrapper instance.
+
+            Unlike PostgreSQLWrapper, the schema is not created here since that needs to be awaited;
+            call ``ensure_schema`` once at startup instead.
+
+            :param uri: The database URI for connecting to PostgreSQL, using an async driver
+                (e.g. postgresql+asyncpg://).
+            :type uri: str
+            :param pool_size: The number of connections kept open in the pool.
+            :type pool_size: int
+            :param max_overflow: The number of connections allowed above ``pool_size``.
+            :type max_overflow: int
+            :param pool_timeout: The number of seconds to wait for a connection before giving up.
+            :type pool_timeout: float
+            :param pool_recycle: The number of seconds after which a connection is replaced, or -1 to never recycle.
+            :type pool_recycle: int
+            :param pool_pre_ping: Whether to test connections for liveness on checkout.
+            :type pool_pre_ping: bool
+        """
+        self.engine = create_async_engine(uri, pool_size=pool_size, max_overflow=max_overflow,
+                                          pool_timeout=pool_timeout, pool_recycle=pool_recycle,
+                                          pool_pre_ping=pool_pre_ping)
+        self.Session = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    async def ensure_schema(self):
+        """
+            Creates the tables unless the database is stamped with the current schema version.
+
+            :return: True if the schema was created, False if it was already up to date.
+            :rtype: bool
+        """
+        async with self.engine.connect() as connection:
+            current = await connection.run_sync(current_schema_version)
+
+        if current == schema_fingerprint(Base.metadata):
+            return False
+
+        async with self.engine.begin() as connection:
+            await connection.run_sync(create_schema, Base.metadata)
+        return True
+
+    async def close(self):
+        """
+            Closes every pooled connection of the engine.
+        """
+        await self.engine.dispose()
+
+    async def add(self, instance):
+        """
+            Adds a new instance to the database and commits the transaction.
+
+            :param instance: The instance to be added to the database.
+            :type instance: Base
+            :return: The added instance with updated attributes.
+            :rtype: Base
+            :raises Exception: If there is an error during the operation.
+        """
+        async with self.Session() as session:
+            try:
+                session.add(instance)
+                await session.commit()
+                await session.refresh(instance)
+                return instance
+            except Exception as e:
+                await session.rollback()
+                raise e
+
+    async def addToM2mTables(self, *, model_name: Table, **kwargs):
+        """
+            Adds a new instance to the database many to many connections if does not already exist.
+
+            :param model_name: The association table name.
+            :type model_name: Table
+            :return: True once the row is inserted or found to exist.
+            :rtype: bool
+            :raises Exception: If there is an error during the operation.
+        """
+        async with self.Session() as session:
+            try:
+                query = insert(model_name).values(**kwargs).on_conflict_do_nothing(
+                    index_elements=kwargs.keys())
+                await session.execute(query)
+                await session.commit()
+                return True
+            except Exception as e:
+                await session.rollback()
+                raise e
+
+    async def query_by_id(self, model, id):
+        """
+            Queries an instance by its ID.
+
+            :param model: The model class to query.
+            :type model: Base
+            :param id: The ID of the instance to query.
+            :type id: int
+            :return: The queried instance, or None if not found.
+            :rtype: Base | None
+        """
+        async with self.Session() as session:
+            try:
+                return await session.get(model, id)
+            except Exception as e:
+                print(f"Error querying instance by ID: {e}")
+                return None
+
+    async def find_by_fields(self, model, filters):
+        """
+            Finds instances based on specified field filters.
+
+            :param model: The model class to query.
+            :type model: Base
+            :param filters: A dictionary of field filters, as accepted by ``PostgreSQLWrapper.find_by_fields``.
+            :type filters: dict
+            :return: A list of instances matching the filters.
+            :rtype: list[Base]
+            :raises ValueError: If a filter uses an unsupported operator.
+        """
+        shape, params = PostgreSQLWrapper._filter_shape(filters)
+        async with self.Session() as session:
+            try:
+                result = await session.execute(_filter_statement(model, shape), params)
+                return result.scalars().all()
+            except Exception as e:
+                print(f"Error finding instances with filters {filters}: {e}")
+                return []
+
+    async def update_many_to_many(self, association, field: str, change: dict):
+        """
+        Updates a many-to-many relationship field for a given model.
+
+        Parameters:
+        - association: The association table to update.
+        - field: The name of the many-to-many relationship field.
+        - change: A dictionary with the current value under 'from' and the new value under 'to'.
+
+        example await update_many_to_many(association=feedbacks_issues_association, field="issue_id", change={'from':3, 'to':4}
+        """
+        if "to" not in change or "from" not in change:
+            raise ValueError("Argument change is invalid should include both 'to' and 'from'")
+
+        async with self.Session() as session:
+            try:
+                stmt = update(association).where(
+                    association.c[field] == change['from']
+                ).values(**{field: change['to']})
+
+                await session.execute(stmt)
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                print(f"An error occurred: {e}")
@@ -1,34 +1,69 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from typing import Any, Dict
 
-from sqlalchemy import create_engine, Column, Integer, Text, Sequence
+from sqlalchemy import Column, Integer, Text, Sequence, MetaData, Table, inspect, select, tuple_, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 
+from connector.postgres.cache import LRUCache
+from connector.postgres.pool import create_monitored_engine
+from connector.postgres.profiler import StatementProfiler
+
 Base = declarative_base()
 
 
-def get_class(tablename: str, mapping: Dict) -> Any:
+# The model attributes every customer table maps, each to the column named by the mapping dict.
+# Other keys of the mapping are mapped as extra attributes, e.g. an insertion timestamp.
+MAPPED_FIELDS = ('id', 'customer_id', 'user_id', 'query', 'context', 'prompt', 'response')
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_class(tablename: str, mapping: Dict, bind=None) -> Any:
     """
-        Dynamically creates a SQLAlchemy model class based on the provided table name and mapping.
+        Returns the SQLAlchemy model class of a table for the provided mapping.
+
+        Each (tablename, mapping) model is built once and reused by later calls, from any thread.
+        Every model has its own MetaData, so the same table can be mapped with different mappings.
 
         :param tablename: The name of the table.
         :type tablename: str
-        :param mapping: A dictionary mapping column names to their attributes.
+        :param mapping: A dictionary mapping column names to their attributes, with every attribute of
+            MAPPED_FIELDS and optionally extra ones, e.g. {'created_at': 'inserted_on'}.
         :type mapping: dict
-        :return: A dynamically created SQLAlchemy model class.
+        :param bind: An engine to reflect the real column types from when the model is first built,
+            or None to leave the columns untyped.
+        :type bind: Engine | None
+        :return: The SQLAlchemy model class of the table.
         :rtype: Any
     """
-    class Class(Base):
-        __tablename__ = tablename
-        id = Column(name=mapping['id'], primary_key=True)
-        customer_id = Column(name=mapping['customer_id'])
-        user_id = Column(name=mapping['user_id'])
-        query = Column(name=mapping['query'])
-        context = Column(name=mapping['context'])
-        prompt = Column(name=mapping['prompt'])
-        response = Column(name=mapping['response'])
+    key = (tablename, tuple(sorted(mapping.items())), bind.url if bind is not None else None)
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                model = _models[key] = _build_class(tablename, mapping, bind)
+    return model
+
+
+def _build_class(tablename: str, mapping: Dict, bind=None):
+    """
+        Builds the model class of a table, reflecting the types of the mapped columns from bind if given.
+    """
+    types = {}
+    if bind is not None:
+        types = {column['name']: column['type'] for column in inspect(bind).get_columns(tablename)}
 
-    return Class
+    fields = list(MAPPED_FIELDS) + sorted(field for field in mapping if field not in MAPPED_FIELDS)
+    table = Table(tablename, MetaData(), *[
+        Column(mapping[field], types.get(mapping[field]), key=field, primary_key=field == 'id')
+        for field in fields
+    ])
+    return type(f'{tablename}_{len(_models)}', (Base,), {'__table__': table})
 
 
 class PostgresReadOnlyWrapper:
@@ -48,8 +83,30 @@ class PostgresReadOnlyWrapper:
         :type dbname: str
         :param port: The port number of the PostgreSQL database. Default is 5432.
         :type port: int
+        :param pool_size: The number of connections kept open in the pool.
+        :type pool_size: int
+        :param max_overflow: The number of connections allowed above ``pool_size``.
+        :type max_overflow: int
+        :param pool_timeout: The number of seconds to wait for a connection before giving up.
+        :type pool_timeout: float
+        :param pool_recycle: The number of seconds after which a connection is replaced, or -1 to never recycle.
+        :type pool_recycle: int
+        :param pool_pre_ping: Whether to test connections for liveness on checkout.
+        :type pool_pre_ping: bool
+        :param trust_schema: Whether to skip creating the tables of the mapped models on startup.
+        :type trust_schema: bool
+        :param profile_statements: Whether to record the latency and row count of every statement per method.
+        :type profile_statements: bool
+        :param slow_query_threshold: The number of seconds above which a profiled statement is logged.
+        :type slow_query_threshold: float
+        :param cache_size: The maximum number of rows cached by ``query_by_ids``, or 0 to disable the cache.
+        :type cache_size: int
+        :param cache_ttl: The number of seconds a cached row stays valid.
+        :type cache_ttl: float
     """
-    def __init__(self, user, password, host, dbname, port=5432):
+    def __init__(self, user, password, host, dbname, port=5432, pool_size=5, max_overflow=10, pool_timeout=30,
+                 pool_recycle=-1, pool_pre_ping=False, trust_schema=False, profile_statements=False,
+                 slow_query_threshold=1.0, cache_size=0, cache_ttl=300):
         """
             Initializes the PostgresReadOnlyWrapper instance.
 
@@ -63,10 +120,39 @@ class PostgresReadOnlyWrapper:
             :type dbname: str
             :param port: The port number of the PostgreSQL database. Default is 5432.
             :type port: int
+            :param pool_size: The number of connections kept open in the pool.
+            :type pool_size: int
+            :param max_overflow: The number of connections allowed above ``pool_size``.
+            :type max_overflow: int
+            :param pool_timeout: The number of seconds to wait for a connection before giving up.
+            :type pool_timeout: float
+            :param pool_recycle: The number of seconds after which a connection is replaced, or -1 to never recycle.
+            :type pool_recycle: int
+            :param pool_pre_ping: Whether to test connections for liveness on checkout.
+            :type pool_pre_ping: bool
+            :param trust_schema: Whether to skip creating the tables of the mapped models on startup.
+            :type trust_schema: bool
+            :param profile_statements: Whether to record the latency and row count of every statement per method.
+            :type profile_statements: bool
+            :param slow_query_threshold: The number of seconds above which a profiled statement is logged.
+            :type slow_query_threshold: float
+            :param cache_size: The maximum number of rows cached by ``query_by_ids``, or 0 to disable the cache.
+            :type cache_size: int
+            :param cache_ttl: The number of seconds a cached row stays valid.
+            :type cache_ttl: float
         """
-        self.engine = create_engine(f'postgresql://{user}:{password}@{host}:{port}/{dbname}')
+        self.engine, self.pool_monitor = create_monitored_engine(f'postgresql://{user}:{password}@{host}:{port}/{dbname}',
+                                                                 pool_size=pool_size, max_overflow=max_overflow,
+                                                                 pool_timeout=pool_timeout, pool_recycle=pool_recycle,
+                                                                 pool_pre_ping=pool_pre_ping)
         self.Session = scoped_session(sessionmaker(bind=self.engine))
-        Base.metadata.create_all(self.engine)
+        self.profiler = None
+        if profile_statements:
+            self.profiler = StatementProfiler(slow_query_threshold)
+            self.profiler.attach(self.engine, self)
+        self.row_cache = LRUCache(cache_size, ttl=cache_ttl) if cache_size else None
+        if not trust_schema:
+            Base.metadata.create_all(self.engine)
 
     def get_session(self):
         """
@@ -77,6 +163,50 @@ class PostgresReadOnlyWrapper:
         """
         return self.Session()
 
+    def get_class(self, tablename: str, mapping: Dict, reflect: bool = False):
+        """
+            Returns the model class of a table of this database for the provided mapping.
+
+            :param tablename: The name of the table.
+            :type tablename: str
+            :param mapping: A dictionary mapping column names to their attributes, with every attribute of
+                MAPPED_FIELDS and optionally extra ones, e.g. {'created_at': 'inserted_on'}.
+            :type mapping: dict
+            :param reflect: Whether to reflect the real column types from the database when the model is first built.
+            :type reflect: bool
+            :return: The SQLAlchemy model class of the table.
+            :rtype: Any
+        """
+        return get_class(tablename, mapping, self.engine if reflect else None)
+
+    def pool_stats(self):
+        """
+            Returns a snapshot of the connection pool statistics.
+
+            :return: The pool size, checked out and overflow connections, checkout wait times and connection ages.
+            :rtype: dict
+        """
+        return self.pool_monitor.stats(self.engine.pool)
+
+    def statement_stats(self):
+        """
+            Returns the aggregated statistics of the statements issued by every method.
+
+            :return: The number of statements, rows and slow statements and the latency percentiles per method,
+                or an empty dict when statements are not profiled.
+            :rtype: dict
+        """
+        return self.profiler.stats() if self.profiler else {}
+
+    def cache_stats(self):
+        """
+            Returns the statistics of the row cache used by ``query_by_ids``.
+
+            :return: The number of cached rows, hits, misses and the hit rate, or an empty dict when the cache is disabled.
+            :rtype: dict
+        """
+        return self.row_cache.stats() if self.row_cache is not None else {}
+
     def query_all(self, model):
         """
            Queries all instances of a model.
@@ -106,3 +236,164 @@ class PostgresReadOnlyWrapper:
         result = session.query(model).get(id)
         session.close()
         return result
+
+    def query_by_ids(self, model, ids, chunk_size: int = 1000):
+        """
+            Queries many instances by their IDs.
+
+            IDs are fetched with ``IN`` queries of at most ``chunk_size`` IDs on a single session.
+            When the row cache is enabled, cached rows are served from it and fetched rows are
+            added to it.
+
+            :param model: The model class to query.
+            :type model: Base
+            :param ids: The IDs of the instances to query.
+            :type ids: Iterable[int]
+            :param chunk_size: The maximum number of IDs per query.
+            :type chunk_size: int
+            :return: The queried instances keyed by ID. IDs that are not found are left out.
+            :rtype: dict
+        """
+        result = {}
+        missing = []
+        for id in dict.fromkeys(ids):
+            instance = self.row_cache.get((model, id)) if self.row_cache is not None else None
+            if instance is None:
+                missing.append(id)
+            else:
+                result[id] = instance
+
+        if not missing:
+            return result
+
+        session = self.get_session()
+        try:
+            for start in range(0, len(missing), chunk_size):
+                for instance in session.scalars(select(model).where(model.id.in_(missing[start:start + chunk_size]))):
+                    result[instance.id] = instance
+                    if self.row_cache is not None:
+                        self.row_cache.put((model, instance.id), instance)
+        finally:
+            session.close()
+        return result
+
+    def extract_incremental(self, model, watermark=None, column: str = 'id', chunk_size: int = 1000):
+        """
+            Extracts the rows added since the last sync, in chunks of at most ``chunk_size`` rows.
+
+            Rows whose ``column`` is above ``watermark`` are read in ascending order with keyset
+            queries, each chunk on its own short session, so a sync costs time proportional to
+            the new rows. Every chunk comes with the watermark to store once it is processed,
+            which makes an interrupted sync resumable. ``column`` must be monotonically increasing
+            for new rows, e.g. the id or an insertion timestamp mapped as an extra attribute by
+            ``get_class``. When it is not unique, a chunk's
+            watermark is the highest value known to be fully read, and rows sharing a later value
+            may be extracted again by a sync resumed from it. A finished sync ends with an empty
+            chunk carrying its final watermark when the last chunk could not report it.
+
+            :param model: The model class to extract from, e.g. one returned by ``get_class``.
+            :type model: Base
+            :param watermark: The watermark stored by the previous sync, or None to extract every row.
+            :type watermark: Any
+            :param column: The name of the monotonically increasing attribute the watermark refers to.
+            :type column: str
+            :param chunk_size: The maximum number of rows per chunk.
+            :type chunk_size: int
+            :return: A generator of (rows, new watermark) pairs.
+            :rtype: Iterator[tuple[list[Base], Any]]
+        """
+        field = getattr(model, column)
+        # Ties on a non unique column are broken by the primary key within a sync.
+        keys = [field] if field is model.id else [field, model.id]
+        last = None
+
+        while True:
+            stmt = select(model).where(field.is_not(None)).order_by(*keys).limit(chunk_size)
+            if last is not None:
+                stmt = stmt.where(tuple_(*keys) > tuple_(*last))
+            elif watermark is not None:
+                stmt = stmt.where(field > watermark)
+
+            session = self.get_session()
+            try:
+                rows = session.scalars(stmt).all()
+            finally:
+                session.close()
+
+            if not rows:
+                if last is not None and watermark != last[0]:
+                    yield [], last[0]
+                return
+            previous = last[0] if last is not None else None
+            last = [getattr(rows[-1], key.key) for key in keys]
+            if len(rows) < chunk_size or len(keys) == 1:
+                watermark = last[0]
+            else:
+                # More rows may share the last value, so only the values below it are complete,
+                # including the last value of the previous chunk.
+                complete = [value for value in [previous] + [getattr(row, column) for row in rows]
+                            if value is not None and value != last[0]]
+                watermark = complete[-1] if complete else watermark
+            yield rows, watermark
+            if len(rows) < chunk_size:
+                return
+
+    def extract_parallel(self, model, range_size: int = 50000, max_workers: int = 4):
+        """
+            Extracts every row of a large table by reading primary key ranges concurrently.
+
+            The id span of the table is split into ranges of ``range_size`` ids, each read on its
+            own pooled connection by one of ``max_workers`` threads. Rows are yielded one range at
+            a time as ranges complete, so chunks arrive in no particular order. At most twice
+            ``max_workers`` ranges are read ahead of the caller, which bounds memory when the
+            caller is slower than the database. ``max_workers`` should stay within the pool size
+            and the connection limits of the database.
+
+            :param model: The model class to extract from, e.g. one returned by ``get_class``.
+            :type model: Base
+            :param range_size: The number of ids per range.
+            :type range_size: int
+            :param max_workers: The maximum number of ranges read concurrently.
+            :type max_workers: int
+            :return: A generator of row chunks, one per non empty range.
+            :rtype: Iterator[list[Base]]
+            :raises ValueError: If the ids of the table are not integers.
+        """
+        session = self.get_session()
+        try:
+            low, high = session.execute(select(func.min(model.id), func.max(model.id))).one()
+        finally:
+            session.close()
+        if low is None:
+            return
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in (low, high)):
+            raise ValueError(f"Parallel extraction splits the table by integer id ranges, "
+                             f"but the ids of {model.__table__.name} are {type(low).__name__}")
+
+        ranges = ((start, start + range_size) for start in range(low, high + 1, range_size))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            try:
+                while True:
+                    for start, end in itertools.islice(ranges, 2 * max_workers - len(pending)):
+                        pending.add(executor.submit(self._read_range, model, start, end))
+                    if not pending:
+                        return
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rows = future.result()
+                        if rows:
+                            yield rows
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _read_range(self, model, start, end):
+        """
+            Reads the rows with an id in [start, end) on a dedicated session.
+        """
+        session = self.Session.session_factory()
+        try:
+            return session.scalars(select(model).where(model.id >= start, model.id < end)).all()
+        finally:
+            session.close()
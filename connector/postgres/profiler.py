@@ -0,0 +1,170 @@
+import inspect
+import logging
+import sys
+import time
+from collections import deque
+from threading import Lock
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+def _redact(parameters):
+    """
+        Replaces every bound value with the name of its type, so that logged statements carry no data.
+    """
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f'<{len(parameters)} parameter sets>'
+        return [type(value).__name__ for value in parameters]
+    return parameters
+
+
+def _percentile(ordered, fraction):
+    """
+        Returns the nearest-rank percentile of an already sorted list.
+    """
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class StatementProfiler:
+    """
+        Profiles the SQL statements an engine executes from SQLAlchemy cursor events.
+
+        Every statement is attributed to the public wrapper method that issued it and its latency
+        and row count are recorded. Statements slower than the threshold are logged as warnings
+        with their parameters redacted. Percentiles are computed over the latest ``samples``
+        latencies of each method.
+
+        :param slow_threshold: The number of seconds above which a statement is logged, or None to never log.
+        :type slow_threshold: float | None
+        :param samples: The number of latencies kept per method, and of statements kept by ``recent``.
+        :type samples: int
+    """
+
+    def __init__(self, slow_threshold: float = 1.0, samples: int = 1000):
+        """
+            Initializes the StatementProfiler instance.
+
+            :param slow_threshold: The number of seconds above which a statement is logged, or None to never log.
+            :type slow_threshold: float | None
+            :param samples: The number of latencies kept per method, and of statements kept by ``recent``.
+            :type samples: int
+        """
+        self.slow_threshold = slow_threshold
+        self.samples = samples
+        self._lock = Lock()
+        self._codes = {}
+        self._methods = {}
+        self._recent = deque(maxlen=samples)
+
+    def attach(self, engine, owner):
+        """
+            Registers the profiler on the cursor events of an engine.
+
+            :param engine: The engine whose statements are profiled.
+            :type engine: Engine
+            :param owner: The wrapper whose methods the statements are attributed to.
+            :type owner: object
+        """
+        for cls in type(owner).__mro__:
+            for name, member in vars(cls).items():
+                function = inspect.unwrap(member.__func__ if isinstance(member, (staticmethod, classmethod))
+                                          else member)
+                if inspect.isfunction(function):
+                    self._codes.setdefault(function.__code__, f'{type(owner).__name__}.{name}')
+
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _method(self):
+        """
+            Finds the wrapper method on the call stack that issued the current statement.
+
+            The innermost public method wins, so statements run by helpers such as ``_commit``
+            are attributed to the method that called them.
+        """
+        private = None
+        frame = sys._getframe(2)
+        while frame is not None:
+            name = self._codes.get(frame.f_code)
+            if name is not None:
+                if not name.rsplit('.', 1)[-1].startswith('_'):
+                    return name
+                private = private or name
+            frame = frame.f_back
+        return private or '<other>'
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._profiler_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._profiler_start
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        method = self._method()
+
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = {'count': 0, 'rows': 0, 'total': 0.0, 'slow': 0,
+                                                 'latencies': deque(maxlen=self.samples)}
+            stats['count'] += 1
+            stats['rows'] += rows or 0
+            stats['total'] += elapsed
+            stats['latencies'].append(elapsed)
+            self._recent.append({'method': method, 'statement': statement, 'latency': elapsed, 'rows': rows})
+
+            slow = self.slow_threshold is not None and elapsed >= self.slow_threshold
+            stats['slow'] += slow
+
+        if slow:
+            logger.warning("Slow statement from %s took %.3fs (%s rows): %s parameters=%s",
+                           method, elapsed, rows, statement, _redact(parameters))
+
+    def stats(self) -> dict:
+        """
+            Returns the aggregated statistics of every method that issued statements.
+
+            :return: For every method, the number of statements, rows and slow statements, the total
+                latency and the p50, p95 and p99 latencies, in seconds.
+            :rtype: dict
+        """
+        with self._lock:
+            snapshot = {method: dict(stats, latencies=sorted(stats['latencies']))
+                        for method, stats in self._methods.items()}
+
+        return {
+            method: {
+                'count': stats['count'],
+                'rows': stats['rows'],
+                'slow': stats['slow'],
+                'latency_total': stats['total'],
+                'latency_p50': _percentile(stats['latencies'], 0.50),
+                'latency_p95': _percentile(stats['latencies'], 0.95),
+                'latency_p99': _percentile(stats['latencies'], 0.99),
+            }
+            for method, stats in snapshot.items()
+        }
+
+    def recent(self) -> list:
+        """
+            Returns the most recent statements, oldest first.
+
+            :return: The method, statement text, latency in seconds and row count of every statement.
+            :rtype: list[dict]
+        """
+        with self._lock:
+            return list(self._recent)
+
+    def reset(self):
+        """
+            Discards every recorded statement.
+        """
+        with self._lock:
+            self._methods.clear()
+            self._recent.clear()
@@ -0,0 +1,186 @@
+from sqlalchemy import select, func, cast, String, false, or_
+from sqlalchemy.dialects.postgresql import insert
+
+from connector.postgres.postgres import PostgreSQLWrapper, Report, ReportStatus, ReportType, ReportSubtype, \
+    UserMessages, Chat, ChatBotAnswers, ProcessingStatus, issues_userMessages_association, user_message_keyword
+
+# The column each report type counts, per subtype. Interaction reports count user messages,
+# chat reports count chats.
+INTERACTION_COLUMNS = {
+    ReportType.INTENT: UserMessages.intent_id,
+    ReportType.ISSUE_TYPE: issues_userMessages_association.c.issue_id,
+    ReportType.HELPFULNESS: UserMessages.helpfulness,
+    ReportType.QUERY_SENTIMENT: UserMessages.sentiment,
+    ReportType.RESPONSE_SENTIMENT: ChatBotAnswers.sentiment,
+    ReportType.SATISFACTION: UserMessages.satisfaction,
+    ReportType.CORRECTNESS: UserMessages.correctness,
+    ReportType.VERBOSITY: UserMessages.verbosity,
+    ReportType.ERROR_RATE: UserMessages.attempt,
+    ReportType.COHERENCE: UserMessages.coherence,
+    ReportType.KEYWORDS: user_message_keyword.c.keyword_id,
+}
+
+CHAT_COLUMNS = {
+    ReportType.INTENT: Chat.intent_id,
+    ReportType.ISSUE_TYPE: Chat.issue_id,
+    ReportType.HELPFULNESS: Chat.helpfulness,
+    ReportType.QUERY_SENTIMENT: Chat.query_sentiment,
+    ReportType.RESPONSE_SENTIMENT: Chat.response_sentiment,
+    ReportType.SATISFACTION: Chat.satisfaction,
+    ReportType.CORRECTNESS: Chat.correctness,
+    ReportType.VERBOSITY: Chat.verbosity,
+    ReportType.ERROR_RATE: Chat.error_rate,
+    ReportType.COHERENCE: Chat.coherence,
+}
+
+
+class ReportEngine:
+    """
+        Computes Report results incrementally with GROUP BY aggregations in PostgreSQL.
+
+        Every report stores the counts per value of the column its type measures, along with the
+        highest user message id it has seen. A refresh only aggregates user messages above that
+        watermark and adds their counts to the stored result. The watermark never passes a user
+        message that is not processed yet, since its metrics are only written back once it is,
+        nor, for chat reports, the first user message of a chat that is not processed yet. A
+        message or chat that is never processed therefore holds the project's reports back: the
+        ones whose processing failed must be marked processed, or deleted, for reports to advance.
+
+        :param wrapper: The wrapper used to access the database.
+        :type wrapper: PostgreSQLWrapper
+    """
+
+    def __init__(self, wrapper: PostgreSQLWrapper):
+        """
+            Initializes the ReportEngine instance.
+
+            :param wrapper: The wrapper used to access the database.
+            :type wrapper: PostgreSQLWrapper
+        """
+        self.wrapper = wrapper
+
+    def refresh(self, project_id: int, report_type: ReportType, subtype: ReportSubtype) -> Report:
+        """
+            Brings the report of a project up to date with its newest user messages.
+
+            The report row is created on first use, at most once thanks to its unique
+            (project_id, type, subtype) index, and locked while it is refreshed, so concurrent
+            refreshes of the same report never count a message twice.
+            Chat reports count a processed chat once, when its first user message passes the watermark.
+
+            :param project_id: The project the report belongs to.
+            :type project_id: int
+            :param report_type: The type of the report.
+            :type report_type: ReportType
+            :param subtype: Whether the report counts chats or interactions.
+            :type subtype: ReportSubtype
+            :return: The refreshed report.
+            :rtype: Report
+            :raises ValueError: If the report type is not supported for the subtype.
+            :raises Exception: If there is an error during the operation.
+        """
+        columns = CHAT_COLUMNS if subtype == ReportSubtype.BY_CHAT else INTERACTION_COLUMNS
+        if report_type not in columns:
+            raise ValueError(f"Report type {report_type.value} is not supported {subtype.value.lower()}")
+
+        session = self.wrapper.get_session()
+        try:
+            session.execute(
+                insert(Report).values(project_id=project_id, type=report_type, subtype=subtype,
+                                      status=ReportStatus.processing, max_user_message_id=0, result={})
+                .on_conflict_do_nothing(index_elements=['project_id', 'type', 'subtype'])
+            )
+            report = session.execute(
+                select(Report)
+                .where(Report.project_id == project_id, Report.type == report_type, Report.subtype == subtype)
+                .with_for_update()
+            ).scalars().one()
+
+            watermark = report.max_user_message_id
+            max_id = max(session.execute(self._processed_watermark(project_id, subtype)).scalar() or 0, watermark)
+
+            result = dict(report.result or {})
+            if max_id > watermark:
+                if subtype == ReportSubtype.BY_CHAT:
+                    stmt = self._chat_counts(columns[report_type], project_id, watermark, max_id)
+                else:
+                    stmt = self._interaction_counts(columns[report_type], project_id, watermark, max_id)
+
+                for value, count in session.execute(stmt):
+                    key = self._result_key(value)
+                    result[key] = result.get(key, 0) + count
+
+            report.result = result
+            report.max_user_message_id = max_id
+            report.status = ReportStatus.done
+            self.wrapper._commit(session)
+            return report
+        except Exception as e:
+            self.wrapper._rollback(session)
+            raise e
+
+    @staticmethod
+    def _processed_watermark(project_id, subtype):
+        """
+            Builds the query of the highest user message id below the project's first unprocessed user message.
+
+            For chat reports, the user messages of chats that are not processed yet count as unprocessed.
+        """
+        unprocessed = UserMessages.processed == false()
+        if subtype == ReportSubtype.BY_CHAT:
+            unprocessed = or_(unprocessed, cast(UserMessages.chat_id, String).in_(
+                select(Chat.id).where(Chat.status != ProcessingStatus.processed)
+            ))
+
+        first_unprocessed = select(func.min(UserMessages.id)).where(
+            UserMessages.project_id == project_id,
+            unprocessed,
+        ).scalar_subquery()
+
+        return select(func.max(UserMessages.id)).where(
+            UserMessages.project_id == project_id,
+            func.coalesce(UserMessages.id < first_unprocessed, True),
+        )
+
+    @staticmethod
+    def _interaction_counts(column, project_id, after_id, up_to_id):
+        """
+            Builds the aggregation counting the user messages in (after_id, up_to_id] per column value.
+        """
+        stmt = select(column, func.count()).select_from(UserMessages)
+        if column.table is not UserMessages.__table__:
+            stmt = stmt.join(column.table)
+
+        return stmt.where(
+            UserMessages.project_id == project_id,
+            UserMessages.id > after_id,
+            UserMessages.id <= up_to_id,
+        ).group_by(column)
+
+    @staticmethod
+    def _chat_counts(column, project_id, after_id, up_to_id):
+        """
+            Builds the aggregation counting the processed chats whose first user message is in (after_id, up_to_id]
+            per column value.
+        """
+        new_chats = select(cast(UserMessages.chat_id, String)).where(
+            UserMessages.project_id == project_id,
+            UserMessages.chat_id.is_not(None),
+        ).group_by(UserMessages.chat_id).having(
+            func.min(UserMessages.id) > after_id,
+            func.min(UserMessages.id) <= up_to_id,
+        )
+
+        return select(column, func.count()).where(
+            Chat.id.in_(new_chats),
+            Chat.status == ProcessingStatus.processed,
+        ).group_by(column)
+
+    @staticmethod
+    def _result_key(value):
+        """
+            Converts an aggregated column value into the key it is stored under in Report.result.
+        """
+        if value is None:
+            return 'unknown'
+        return str(getattr(value, 'value', value))
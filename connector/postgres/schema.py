@@ -0,0 +1,195 @@
+from functools import lru_cache
+import hashlib
+import logging
+
+from sqlalchemy import MetaData, Table, Column, String, select, delete, insert, text, exc, inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable, CreateIndex
+
+logger = logging.getLogger(__name__)
+
+schema_metadata = MetaData()
+
+schema_version_table = Table('schema_version', schema_metadata,
+                             Column('version', String(64), primary_key=True))
+
+# Key of the advisory lock held while the schema is created, so that processes starting
+# together do not race each other's DDL.
+SCHEMA_LOCK_KEY = 7361626
+
+
+@lru_cache(maxsize=None)
+def schema_fingerprint(metadata: MetaData) -> str:
+    """
+        Computes a digest of the DDL of every table and index in the metadata.
+
+        :param metadata: The metadata to fingerprint.
+        :type metadata: MetaData
+        :return: The hex encoded SHA-256 digest of the schema.
+        :rtype: str
+    """
+    dialect = postgresql.dialect()
+    digest = hashlib.sha256()
+    for table in metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode('utf-8'))
+        for index in sorted(table.indexes, key=lambda index: index.name or ''):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def current_schema_version(connection):
+    """
+        Reads the schema version the database is stamped with.
+
+        :param connection: A connection to the database.
+        :type connection: Connection
+        :return: The stamped version, or None if the database is not stamped.
+        :rtype: str | None
+    """
+    try:
+        return connection.execute(select(schema_version_table.c.version)).scalar()
+    except exc.DBAPIError:
+        return None
+
+
+def create_schema(connection, metadata: MetaData):
+    """
+        Creates the missing tables of the metadata under an advisory lock and stamps the database with their version.
+
+        Indexes added to tables that already exist are not created here, see ``create_indexes``.
+
+        :param connection: A connection to the database, inside a transaction.
+        :type connection: Connection
+        :param metadata: The metadata whose tables are created.
+        :type metadata: MetaData
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': SCHEMA_LOCK_KEY})
+    metadata.create_all(connection)
+    schema_metadata.create_all(connection)
+    connection.execute(delete(schema_version_table))
+    connection.execute(insert(schema_version_table).values(version=schema_fingerprint(metadata)))
+
+
+def ensure_schema(engine, metadata: MetaData) -> bool:
+    """
+        Creates the tables of the metadata unless the database is stamped with the current schema version.
+
+        An up to date database costs a single query. Otherwise ``create_all`` runs under an
+        advisory lock and the database is stamped with the new version.
+
+        :param engine: The engine of the database.
+        :type engine: Engine
+        :param metadata: The metadata whose tables are created.
+        :type metadata: MetaData
+        :return: True if the schema was created, False if it was already up to date.
+        :rtype: bool
+    """
+    with engine.connect() as connection:
+        current = current_schema_version(connection)
+
+    if current == schema_fingerprint(metadata):
+        return False
+
+    with engine.begin() as connection:
+        create_schema(connection, metadata)
+    return True
+
+
+def create_indexes(engine, metadata: MetaData) -> list:
+    """
+        Creates the indexes of the metadata that are missing from tables that already exist.
+
+        ``create_all`` skips existing tables, so indexes declared on them later are only created
+        by this explicit migration step. On PostgreSQL every index is built with
+        ``CREATE INDEX CONCURRENTLY`` outside of a transaction, so writes to the table are not
+        blocked while it builds, and an invalid index left by an interrupted build is dropped and
+        built again. An index that fails to build, e.g. a unique index over duplicate rows, is
+        logged, its invalid leftover dropped, and the remaining indexes are still created; it is
+        built by the next run once its cause is fixed. Run it once per deployment, not from every
+        worker.
+
+        :param engine: The engine of the database.
+        :type engine: Engine
+        :param metadata: The metadata whose indexes are created.
+        :type metadata: MetaData
+        :return: The names of the created indexes, without the ones that failed to build.
+        :rtype: list[str]
+    """
+    created = []
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if connection.dialect.name != 'postgresql':
+            for table in metadata.sorted_tables:
+                for index in table.indexes:
+                    if index.name in {existing['name'] for existing in inspect(connection).get_indexes(table.name)}:
+                        continue
+                    try:
+                        index.create(connection)
+                    except exc.DBAPIError as e:
+                        logger.warning("Could not create index %s: %s", index.name, e)
+                        continue
+                    created.append(index.name)
+            return created
+
+        valid = dict(connection.execute(text(
+            "SELECT c.relname, i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = current_schema()"
+        )).all())
+
+        for table in metadata.sorted_tables:
+            for index in table.indexes:
+                if valid.get(index.name):
+                    continue
+                if index.name in valid:
+                    connection.execute(text(f'DROP INDEX CONCURRENTLY "{index.name}"'))
+
+                options = index.dialect_options['postgresql']
+                concurrently = options['concurrently']
+                options['concurrently'] = True
+                try:
+                    connection.execute(CreateIndex(index))
+                except exc.DBAPIError as e:
+                    logger.warning("Could not create index %s: %s", index.name, e)
+                    connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+                    continue
+                finally:
+                    options['concurrently'] = concurrently
+                created.append(index.name)
+    return created
+
+
+def add_missing_columns(engine, metadata: MetaData) -> list:
+    """
+        Adds the columns of the metadata that are missing from tables that already exist.
+
+        ``create_all`` skips existing tables, so columns declared on them later are only added by
+        this explicit migration step, which must run before code mapping those columns queries the
+        tables. Columns are added as nullable and without a default, which PostgreSQL does without
+        rewriting the table.
+
+        :param engine: The engine of the database.
+        :type engine: Engine
+        :param metadata: The metadata whose columns are added.
+        :type metadata: MetaData
+        :return: The added columns, as 'table.column'.
+        :rtype: list[str]
+    """
+    added = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        preparer = connection.dialect.identifier_preparer
+        tables = set(inspector.get_table_names())
+        for table in metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                connection.execute(text(
+                    f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} '
+                    f'{column.type.compile(dialect=connection.dialect)}'
+                ))
+                added.append(f'{table.name}.{column.name}')
+    return added
+
@@ -0,0 +1,207 @@
+import threading
+from typing import Dict
+
+from sqlalchemy import MetaData, Table, Column, BigInteger, Integer, Text, select, table, column, null
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from connector.postgres.copy import CopyBuffer, compile_literal, copy_from, copy_to
+from connector.postgres.postgres import PostgreSQLWrapper
+from connector.postgres.postgres_read_only import PostgresReadOnlyWrapper
+
+# The source columns copied into staging, in COPY order. Fields missing from the mapping are copied as NULL,
+# so the feedback fields are only transferred when the mapping names them.
+STAGED_FIELDS = ('id', 'user_id', 'query', 'context', 'prompt', 'response', 'feedback', 'thumbs_up', 'rating')
+
+staging_table = Table(
+    'transfer_staging', MetaData(),
+    Column('source_id', BigInteger),
+    *[Column(field, Text) for field in STAGED_FIELDS[1:]],
+    Column('context_id', Integer),
+    Column('feedback_id', Integer),
+    prefixes=['TEMPORARY'],
+    postgresql_on_commit='DROP',
+)
+
+STAGING_DDL = str(CreateTable(staging_table).compile(dialect=postgresql.dialect()))
+
+STAGING_COPY = f"COPY transfer_staging (source_id, {', '.join(STAGED_FIELDS[1:])}) FROM STDIN WITH (FORMAT csv)"
+
+# The set-based merge of the staged rows, run in order in the transaction that staged them.
+MERGE_STATEMENTS = {
+    'contexts': """
+        INSERT INTO "contextsOriginal" (project_id, text, digest)
+        SELECT DISTINCT %(project_id)s, context, encode(sha256(convert_to(context, 'UTF8')), 'hex')
+        FROM transfer_staging WHERE context IS NOT NULL
+        ON CONFLICT (project_id, digest) DO NOTHING
+        """,
+    'context_ids': """
+        UPDATE transfer_staging s SET context_id = c.id
+        FROM "contextsOriginal" c
+        WHERE c.project_id = %(project_id)s AND c.digest = encode(sha256(convert_to(s.context, 'UTF8')), 'hex')
+        """,
+    'feedback_ids': """
+        UPDATE transfer_staging SET feedback_id = nextval(pg_get_serial_sequence('"feedbacksOriginal"', 'id'))
+        WHERE feedback IS NOT NULL OR thumbs_up IS NOT NULL OR rating IS NOT NULL
+        """,
+    'feedbacks': r"""
+        INSERT INTO "feedbacksOriginal" (id, user_id, project_id, text, date, source, thumbs_up, rating)
+        SELECT feedback_id, CASE WHEN user_id ~ '^-?[0-9]{1,9}$' THEN user_id::integer END, %(project_id)s,
+               feedback, timezone('utc', now()), %(source)s, thumbs_up,
+               CASE WHEN rating ~ '^-?[0-9]+(\.[0-9]+)?$' THEN rating::double precision END
+        FROM transfer_staging WHERE feedback_id IS NOT NULL
+        ORDER BY source_id
+        """,
+    'messages': """
+        INSERT INTO "messagesOriginal" (user_id, project_id, role, text, prompt, date, context_id, feedback_id)
+        SELECT CASE WHEN s.user_id ~ '^-?[0-9]{1,9}$' THEN s.user_id::integer END, %(project_id)s,
+               m.role, m.text, m.prompt, timezone('utc', now()), s.context_id, m.feedback_id
+        FROM transfer_staging s
+        CROSS JOIN LATERAL (VALUES (0, 'user', s.query, NULL::text, NULL::integer),
+                                   (1, 'assistant', s.response, s.prompt, s.feedback_id))
+            AS m (position, role, text, prompt, feedback_id)
+        WHERE m.text IS NOT NULL
+        ORDER BY s.source_id, m.position
+        """,
+}
+
+
+class TransferPipeline:
+    """
+        Transfers a customer's interactions table into MessagesOriginal, ContextsOriginal and FeedbacksOriginal.
+
+        The source rows are streamed with ``COPY ... TO STDOUT`` from the customer database and fed,
+        through a bounded CopyBuffer, into ``COPY ... FROM STDIN`` of a temporary staging table in
+        our database. The staged rows are then merged with set-based statements in the same
+        transaction: contexts are interned by digest, and every row becomes a user message with
+        its query and an assistant message with its response and prompt, linked to its context
+        and feedback. Nothing is visible until the whole transfer commits. Digests are computed with
+        ``sha256()``, so our database must run PostgreSQL 11 or higher.
+
+        :param source: The wrapper of the customer database.
+        :type source: PostgresReadOnlyWrapper
+        :param target: The wrapper of our database.
+        :type target: PostgreSQLWrapper
+        :param buffer_chunks: The maximum number of chunks buffered between the two COPY statements.
+        :type buffer_chunks: int
+        :param chunk_bytes: The size of a buffered chunk, in bytes.
+        :type chunk_bytes: int
+    """
+
+    def __init__(self, source: PostgresReadOnlyWrapper, target: PostgreSQLWrapper, buffer_chunks: int = 16,
+                 chunk_bytes: int = 1 << 20):
+        """
+            Initializes the TransferPipeline instance.
+
+            :param source: The wrapper of the customer database.
+            :type source: PostgresReadOnlyWrapper
+            :param target: The wrapper of our database.
+            :type target: PostgreSQLWrapper
+            :param buffer_chunks: The maximum number of chunks buffered between the two COPY statements.
+            :type buffer_chunks: int
+            :param chunk_bytes: The size of a buffered chunk, in bytes.
+            :type chunk_bytes: int
+        """
+        self.source = source
+        self.target = target
+        self.buffer_chunks = buffer_chunks
+        self.chunk_bytes = chunk_bytes
+
+    def transfer(self, tablename: str, mapping: Dict, project_id: int, customer_id=None, after_id=None,
+                 source: str = 'transfer') -> dict:
+        """
+            Transfers the rows of a customer table into the project.
+
+            Messages carry no reference to their source row, so repeated transfers should pass the
+            returned watermark as ``after_id`` to only transfer the rows added since.
+
+            :param tablename: The name of the customer table.
+            :type tablename: str
+            :param mapping: A dictionary mapping column names to their attributes, as accepted by ``get_class``,
+                optionally with 'feedback', 'thumbs_up' and 'rating' columns.
+            :type mapping: dict
+            :param project_id: The project the rows are transferred into.
+            :type project_id: int
+            :param customer_id: The customer whose rows are transferred, or None for every row.
+            :type customer_id: Any
+            :param after_id: The integer source id after which rows are transferred, or None for every row.
+            :type after_id: int | None
+            :param source: The source stored on the transferred feedbacks.
+            :type source: str
+            :return: The number of staged rows, of created contexts, feedbacks and messages, and the highest
+                transferred source id under 'watermark'.
+            :rtype: dict
+            :raises Exception: If there is an error on either side; nothing is merged then.
+        """
+        buffer = CopyBuffer(self.buffer_chunks, self.chunk_bytes)
+        errors = []
+        producer = threading.Thread(target=self._produce,
+                                    args=(self._source_copy(tablename, mapping, customer_id, after_id), buffer, errors),
+                                    daemon=True)
+
+        connection = self.target.engine.raw_connection()
+        try:
+            cursor = connection.driver_connection.cursor()
+            cursor.execute(STAGING_DDL)
+
+            producer.start()
+            try:
+                counts = {'rows': copy_from(connection.driver_connection, STAGING_COPY, buffer)}
+            except BaseException:
+                buffer.abort()
+                raise
+            finally:
+                producer.join()
+            if errors:
+                raise errors[0]
+
+            params = {'project_id': project_id, 'source': source}
+            for name, statement in MERGE_STATEMENTS.items():
+                cursor.execute(statement, params)
+                if name in ('contexts', 'feedbacks', 'messages'):
+                    counts[name] = cursor.rowcount
+
+            cursor.execute('SELECT max(source_id) FROM transfer_staging')
+            counts['watermark'] = cursor.fetchone()[0]
+            if counts['watermark'] is None:
+                counts['watermark'] = after_id
+            cursor.close()
+
+            connection.commit()
+            return counts
+        except Exception as e:
+            connection.rollback()
+            raise e
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _source_copy(tablename, mapping, customer_id, after_id):
+        """
+            Builds the COPY statement that streams the mapped source columns in staging order.
+        """
+        source = table(tablename, *[column(name) for name in set(mapping.values())])
+        stmt = select(*[(source.c[mapping[field]] if field in mapping else null()).label(field) for field in STAGED_FIELDS])
+        if customer_id is not None:
+            stmt = stmt.where(source.c[mapping['customer_id']] == customer_id)
+        if after_id is not None:
+            stmt = stmt.where(source.c[mapping['id']] > after_id)
+        return f"COPY ({compile_literal(stmt)}) TO STDOUT WITH (FORMAT csv)"
+
+    def _produce(self, sql, buffer, errors):
+        """
+            Streams the source COPY into the buffer, recording its error if it fails.
+        """
+        connection = self.source.engine.raw_connection()
+        try:
+            copy_to(connection.driver_connection, sql, buffer)
+            connection.commit()
+            buffer.close()
+        except BaseException as e:
+            errors.append(e)
+            try:
+                buffer.close()
+            except Exception:
+                pass
+        finally:
+            connection.close()
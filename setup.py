@@ -12,6 +12,9 @@ setup(
         'sqlalchemy',
         'psycopg2',
     ],
+    extras_require={
+        'async': ['asyncpg'],
+    },
     author='Feedback Intelligence',
     author_email='tigran@manot.ai',
     description='Connectors for different databases',